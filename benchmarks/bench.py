@@ -0,0 +1,320 @@
+"""记忆插件性能基准
+
+用合成数据集驱动 Main.on_llm_request、MemoryManager.add_memory / search_memories /
+save_memories / _load_memories 与去重索引，统计延迟分位数、吞吐量与峰值内存，结果写入 JSON 便于跨版本对比。
+
+用法 (在插件目录下执行):
+    python benchmarks/bench.py
+    python benchmarks/bench.py --scales 1x300,10000x30 --storage-mode journal -o new.json
+    python benchmarks/bench.py -o new.json --compare old.json
+"""
+import argparse
+import asyncio
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+import stubs  # noqa: E402
+
+DEFAULT_SCALES = "1x300,100x300,1000x100,10000x30"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+CJK_PHRASES = [
+    "喜欢吃火锅", "明天要去上海出差", "最近在学习吉他", "家里养了一只橘猫", "生日是五月二十号",
+    "不喜欢香菜", "周末经常去爬山", "正在准备考研", "在杭州工作", "最喜欢的颜色是蓝色",
+    "对花生过敏", "每天早上跑步五公里", "喜欢看科幻电影", "打算明年换工作", "妹妹在读高中",
+]
+LATIN_WORDS = [
+    "Python", "Rust", "Minecraft", "Genshin", "iPhone", "Steam", "GitHub", "Docker",
+    "Linux", "Switch", "Spotify", "Kindle", "Bilibili", "VSCode", "Arch",
+]
+QUERY_TEMPLATES = [
+    "你还记得我{}吗", "{}怎么样", "我之前说过{}", "关于{}你知道什么", "{}",
+]
+
+
+def make_content(rng: random.Random, n: int) -> str:
+    name = f"用户{rng.randrange(1000)}"
+    qq = rng.randrange(10000, 99999999)
+    parts = [rng.choice(CJK_PHRASES)]
+    if rng.random() < 0.6:
+        parts.append(f"常用{rng.choice(LATIN_WORDS)}")
+    if rng.random() < 0.3:
+        parts.append(rng.choice(CJK_PHRASES))
+    return f"[{name}({qq}) 提到]: {'，'.join(parts)} #{n}"
+
+
+def make_query(rng: random.Random) -> str:
+    subject = rng.choice(CJK_PHRASES) if rng.random() < 0.7 else rng.choice(LATIN_WORDS)
+    if rng.random() < 0.5:
+        subject = subject[rng.randrange(len(subject) // 2 + 1):]
+    return rng.choice(QUERY_TEMPLATES).format(subject)
+
+
+def make_dataset(rng: random.Random, sessions: int, per_session: int) -> dict:
+    """生成与插件存储格式一致的记忆数据"""
+    base = time.time() - 30 * 86400
+    data = {}
+    n = 0
+    for s in range(sessions):
+        sid = f"bench:GroupMessage:{s}"
+        records = []
+        for _ in range(per_session):
+            epoch = base + rng.random() * 30 * 86400
+            dt = datetime.datetime.fromtimestamp(epoch)
+            records.append({
+                "content": make_content(rng, n),
+                "importance": rng.randint(1, 5),
+                "timestamp": dt.strftime(TIMESTAMP_FORMAT),
+                "epoch": epoch,
+                "memory_id": f"{sid}_{dt.strftime('%Y%m%d%H%M%S')}",
+            })
+            n += 1
+        data[sid] = records
+    return data
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """延迟样本 (秒) -> 分位数 (毫秒) 与吞吐量"""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 4),
+        "p50_ms": round(pct(50), 4),
+        "p90_ms": round(pct(90), 4),
+        "p99_ms": round(pct(99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "ops_per_sec": round(len(ordered) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+async def measure(name: str, op, iterations: int, trace_iterations: int = 3) -> dict:
+    """计时运行 op (可为协程函数)，再以 tracemalloc 跑少量迭代记录峰值内存"""
+    is_async = asyncio.iscoroutinefunction(op)
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        if is_async:
+            await op(i)
+        else:
+            op(i)
+        samples.append(time.perf_counter() - t0)
+    result = summarize(samples, time.perf_counter() - started)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for i in range(iterations, iterations + trace_iterations):
+        if is_async:
+            await op(i)
+        else:
+            op(i)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result["peak_kb"] = round((peak - baseline) / 1024, 1)
+    print(f"  {name:<24} p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  "
+          f"{result['ops_per_sec'] or 0:>10.1f} op/s  peak {result['peak_kb']:>10.1f} KB")
+    return result
+
+
+async def run_scale(plugin, sessions: int, per_session: int, args) -> dict:
+    rng = random.Random(args.seed)
+    data_dir = tempfile.mkdtemp(prefix="ai_memory_bench_")
+    try:
+        stubs.install(data_dir)
+        main_module = importlib.import_module(f"{plugin}.main")
+        data_file = os.path.join(data_dir, "memory_data.json")
+        with open(data_file, "w", encoding="utf-8") as f:
+            json.dump(make_dataset(rng, sessions, per_session), f, ensure_ascii=False)
+        print(f"[{sessions} 会话 x {per_session} 条] 数据文件 {os.path.getsize(data_file) / 1048576:.1f} MB")
+
+        provider = stubs.FakeProvider(latency_ms=args.rerank_latency_ms)
+        config = {
+            "max_memories": max(per_session, 1),
+            "storage_mode": args.storage_mode,
+            "snapshot_codec": args.snapshot_codec,
+            "scoring_engine": args.scoring_engine,
+            "rerank_provider_id": "",
+        }
+        bot = main_module.Main(stubs.Context({"bench-rerank": provider}), config)
+        manager = bot.memory_manager
+        await manager.wait_ready()
+        # 首次加载可能触发格式迁移，先落盘一次，使后续计时都基于稳定的存储状态
+        await manager.save_memories()
+        session_ids = manager.session_ids()
+        results = {}
+
+        tracemalloc.start()
+        manager._load_memories()
+        results["load_peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+        results["_load_memories"] = await measure(
+            "_load_memories", lambda i: manager._load_memories(), args.load_iterations, 1)
+
+        queries = [(rng.choice(session_ids), make_query(rng)) for _ in range(args.iterations * 2 + 10)]
+
+        def llm_request(offset):
+            async def op(i):
+                sid, query = queries[(offset + i) % len(queries)]
+                await bot.on_llm_request(stubs.AstrMessageEvent(query, sid), stubs.ProviderRequest())
+            return op
+
+        results["on_llm_request"] = await measure("on_llm_request", llm_request(0), args.iterations)
+        # 精选使用另一批查询，避免命中上一轮留下的精选缓存
+        bot.config_manager.get_config()["rerank_provider_id"] = "bench-rerank"
+        results["on_llm_request_rerank"] = await measure(
+            "on_llm_request_rerank", llm_request(args.iterations + 5), args.iterations)
+        bot.config_manager.get_config()["rerank_provider_id"] = ""
+
+        results["search_memories"] = await measure(
+            "search_memories",
+            lambda i: manager.search_memories(queries[i % len(queries)][0],
+                                              rng.choice(CJK_PHRASES + LATIN_WORDS)[:3]),
+            args.iterations)
+
+        # 去重索引：整会话构建 (会话首次新增、分片卸载后重新访问时发生) 与单次查重，并以旧版逐条扫描作对照
+        dedup_index = importlib.import_module(f"{plugin}.dedup").DedupIndex
+        dedup_memories = manager.get_memories(max(session_ids, key=manager.get_session_size))
+        results["dedup_build"] = await measure(
+            "dedup_build", lambda i: dedup_index(dedup_memories), args.iterations)
+        deduper = dedup_index(dedup_memories)
+        probes = [make_content(rng, 30_000_000 + i) for i in range(args.iterations + 3)]
+        results["dedup_find"] = await measure("dedup_find", lambda i: deduper.find(probes[i]), args.iterations)
+
+        def linear_scan(i):
+            content = probes[i]
+            return next((m for m in dedup_memories
+                         if content == m["content"] or (len(content) > 10 and content in m["content"])), None)
+
+        results["dedup_linear_scan"] = await measure("dedup_linear_scan", linear_scan, args.iterations)
+
+        adds = [(rng.choice(session_ids), make_content(rng, 10_000_000 + i))
+                for i in range(args.iterations + 3)]
+        results["add_memory"] = await measure(
+            "add_memory", lambda i: manager.add_memory(adds[i][0], adds[i][1], rng.randint(1, 5)),
+            args.iterations)
+
+        async def save(i):
+            sid = rng.choice(session_ids)
+            manager.add_memory(sid, make_content(rng, 20_000_000 + i), 3)
+            await manager.save_memories()
+
+        results["save_memories"] = await measure("save_memories", save, args.save_iterations, 1)
+        await bot.terminate()
+        return {
+            "sessions": sessions,
+            "memories_per_session": per_session,
+            "data_file_bytes": os.path.getsize(data_file),
+            "benchmarks": results,
+            # 插件自身记录的分阶段耗时，便于定位端到端退化来自哪个阶段
+            "plugin_metrics": bot.get_perf_metrics(),
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PLUGIN_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> int:
+    """与基线结果逐项对比 p50/p99，返回退化项数量"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["sessions"], r["memories_per_session"]): r["benchmarks"] for r in baseline["results"]}
+    regressions = 0
+    print(f"\n对比基线 {baseline_path} (rev {baseline['meta'].get('git_revision') or '?'})，阈值 x{threshold}")
+    for run in current["results"]:
+        before = old.get((run["sessions"], run["memories_per_session"]))
+        if before is None:
+            continue
+        for name, stats in run["benchmarks"].items():
+            if not isinstance(stats, dict) or name not in before:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                prev, now = before[name][key], stats[key]
+                ratio = now / prev if prev else 1.0
+                flag = ""
+                if ratio > threshold:
+                    flag = "  <-- 退化"
+                    regressions += 1
+                print(f"  {run['sessions']}x{run['memories_per_session']} {name:<24} {key} "
+                      f"{prev:>9.3f} -> {now:>9.3f} ms (x{ratio:.2f}){flag}")
+    return regressions
+
+
+def parse_scales(text: str):
+    scales = []
+    for item in text.split(","):
+        sessions, _, per_session = item.strip().partition("x")
+        scales.append((int(sessions), int(per_session or 300)))
+    return scales
+
+
+async def main(args) -> int:
+    plugin = os.path.basename(PLUGIN_DIR)
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "created_at": datetime.datetime.now().strftime(TIMESTAMP_FORMAT),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage_mode": args.storage_mode,
+            "snapshot_codec": args.snapshot_codec,
+            "scoring_engine": args.scoring_engine,
+            "iterations": args.iterations,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+    for sessions, per_session in parse_scales(args.scales):
+        report["results"].append(await run_scale(plugin, sessions, per_session, args))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI 记忆插件性能基准")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help=f"数据规模，逗号分隔的 会话数x每会话记忆数 (默认 {DEFAULT_SCALES})")
+    parser.add_argument("--iterations", type=int, default=500, help="每项基准的计时迭代次数")
+    parser.add_argument("--load-iterations", type=int, default=5, help="_load_memories 的迭代次数")
+    parser.add_argument("--save-iterations", type=int, default=20, help="save_memories 的迭代次数")
+    parser.add_argument("--storage-mode", default="snapshot", help="storage_mode 配置")
+    parser.add_argument("--snapshot-codec", default="json", help="snapshot_codec 配置")
+    parser.add_argument("--scoring-engine", default="bigram", help="scoring_engine 配置")
+    parser.add_argument("--rerank-latency-ms", type=float, default=0.0, help="模拟精选模型的响应延迟")
+    parser.add_argument("--seed", type=int, default=20240601)
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果 JSON 路径")
+    parser.add_argument("--compare", help="基线结果 JSON，逐项对比 p50/p99")
+    parser.add_argument("--threshold", type=float, default=1.2, help="判定退化的倍数阈值")
+    sys.exit(asyncio.run(main(parser.parse_args())))
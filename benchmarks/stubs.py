@@ -0,0 +1,140 @@
+"""AstrBot 运行时的最小替身，仅供基准测试在未安装 AstrBot 的环境中导入插件
+
+只实现 main.py 实际用到的接口：装饰器原样返回被装饰函数，事件/请求/模型对象只保留被读取的字段。
+"""
+import asyncio
+import re
+import sys
+import types
+from typing import List, Optional
+
+
+class AstrMessageEvent:
+    def __init__(self, message_str: str, session_id: str, group_id: str = "",
+                 role: str = "member", sender_id: str = "10000", sender_name: str = "bench"):
+        self.message_str = message_str
+        self.unified_msg_origin = session_id
+        self.session_id = session_id
+        self.role = role
+        self._group_id = group_id
+        self._sender_id = sender_id
+        self._sender_name = sender_name
+
+    def get_group_id(self) -> str:
+        return self._group_id
+
+    def get_sender_id(self) -> str:
+        return self._sender_id
+
+    def get_sender_name(self) -> str:
+        return self._sender_name
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+
+class MessageEventResult:
+    pass
+
+
+class ProviderRequest:
+    def __init__(self, prompt: str = "", system_prompt: str = ""):
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+
+
+class LLMResponse:
+    def __init__(self, completion_text: str):
+        self.completion_text = completion_text
+
+
+class FakeProvider:
+    """固定延迟的精选模型：总是选中前 k 个候选 (批量提示则逐个任务作答)"""
+
+    def __init__(self, latency_ms: float = 0.0, pick: int = 3):
+        self.latency = latency_ms / 1000
+        self.pick = pick
+        self.calls = 0
+
+    async def text_chat(self, prompt: str, contexts: Optional[List] = None) -> LLMResponse:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        ids = ",".join(str(i) for i in range(self.pick))
+        tasks = re.findall(r"^### 任务 (\d+)", prompt, re.M)
+        if tasks:
+            return LLMResponse("\n".join(f"任务{n}: {ids}" for n in tasks))
+        return LLMResponse(ids)
+
+
+class Context:
+    def __init__(self, providers: Optional[dict] = None):
+        self.providers = providers or {}
+
+    def get_provider_by_id(self, provider_id: str):
+        return self.providers.get(provider_id)
+
+
+class Star:
+    def __init__(self, context: Context):
+        self.context = context
+
+
+class StarTools:
+    data_dir = "."
+
+    @classmethod
+    def get_data_dir(cls) -> str:
+        return cls.data_dir
+
+
+def _passthrough(*args, **kwargs):
+    def decorator(func):
+        func.command = _passthrough
+        return func
+    return decorator
+
+
+def install(data_dir: str):
+    """向 sys.modules 注册 astrbot.api.* 替身模块，数据目录指向 data_dir"""
+    StarTools.data_dir = data_dir
+
+    filter_module = types.ModuleType("astrbot.api.event.filter")
+    filter_module.command = _passthrough
+    filter_module.command_group = _passthrough
+    filter_module.event_message_type = _passthrough
+    filter_module.on_llm_request = _passthrough
+    filter_module.permission_type = _passthrough
+
+    event_module = types.ModuleType("astrbot.api.event")
+    event_module.AstrMessageEvent = AstrMessageEvent
+    event_module.MessageEventResult = MessageEventResult
+    event_module.filter = filter_module
+
+    star_module = types.ModuleType("astrbot.api.star")
+    star_module.Context = Context
+    star_module.Star = Star
+    star_module.StarTools = StarTools
+    star_module.register = _passthrough
+
+    provider_module = types.ModuleType("astrbot.api.provider")
+    provider_module.ProviderRequest = ProviderRequest
+    provider_module.LLMResponse = LLMResponse
+
+    api_module = types.ModuleType("astrbot.api")
+    api_module.llm_tool = _passthrough
+    api_module.event = event_module
+    api_module.star = star_module
+    api_module.provider = provider_module
+
+    root_module = types.ModuleType("astrbot")
+    root_module.api = api_module
+
+    sys.modules.update({
+        "astrbot": root_module,
+        "astrbot.api": api_module,
+        "astrbot.api.event": event_module,
+        "astrbot.api.event.filter": filter_module,
+        "astrbot.api.star": star_module,
+        "astrbot.api.provider": provider_module,
+    })
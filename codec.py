@@ -0,0 +1,208 @@
+import io
+import os
+import json
+import marshal
+import logging
+from typing import Any, Iterator, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时使用标准库 json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack 为可选依赖，缺失时 msgpack 格式退回 marshal
+    msgpack = None
+
+logger = logging.getLogger("astrbot")
+
+# 文件头: 魔数 + 格式版本 + 编码格式编号，共 6 字节；没有文件头的文件按旧版 JSON 文本读取
+MAGIC = b"AMEM"
+HEADER_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 2
+
+# 旧版格式：带缩进的 JSON 文本，不写文件头，可直接阅读与手工编辑
+PRETTY = "json_pretty"
+
+_FORMAT_IDS = {"json": 1, "msgpack": 2, "marshal": 3}
+_FORMAT_NAMES = {v: k for k, v in _FORMAT_IDS.items()}
+CODECS = (PRETTY,) + tuple(_FORMAT_IDS)
+
+# 超过此大小的 JSON 文件逐个顶层键值增量解析，峰值内存接近最终数据大小；较小的文件整体解析更快
+STREAM_THRESHOLD = 8 * 1024 * 1024
+STREAM_CHUNK = 1024 * 1024
+
+_warned_no_msgpack = False
+
+
+def resolve_codec(name: str) -> str:
+    """配置的编码格式 -> 实际可用的编码格式 (未知名称按 json 处理，msgpack 未安装时退回 marshal)"""
+    global _warned_no_msgpack
+    if name not in CODECS:
+        return "json"
+    if name == "msgpack" and msgpack is None:
+        if not _warned_no_msgpack:
+            _warned_no_msgpack = True
+            logger.warning("未安装 msgpack，快照改用 marshal 格式保存")
+        return "marshal"
+    return name
+
+
+def _json_dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode(data: Any, codec: str = "json") -> bytes:
+    """按指定格式编码 (json 在安装了 orjson 时由其生成，输出仍是标准 JSON)"""
+    codec = resolve_codec(codec)
+    if codec == PRETTY:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    if codec == "msgpack":
+        body = msgpack.packb(data, use_bin_type=True)
+    elif codec == "marshal":
+        body = marshal.dumps(data)
+    else:
+        body = _json_dumps(data)
+    return MAGIC + bytes((HEADER_VERSION, _FORMAT_IDS[codec])) + body
+
+
+def detect(raw: bytes) -> str:
+    """识别数据的编码格式，无文件头时视为旧版 JSON 文本"""
+    if not raw.startswith(MAGIC):
+        return PRETTY
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("记忆数据文件头不完整")
+    version, format_id = raw[len(MAGIC)], raw[len(MAGIC) + 1]
+    if version > HEADER_VERSION:
+        raise ValueError(f"不支持的记忆数据格式版本: {version}")
+    if format_id not in _FORMAT_NAMES:
+        raise ValueError(f"未知的记忆数据编码格式: {format_id}")
+    return _FORMAT_NAMES[format_id]
+
+
+def decode(raw: bytes) -> Tuple[Any, str]:
+    """解码任意格式的数据，返回 (数据, 编码格式)
+
+    marshal 只用于读取插件自己写出的文件，不要用它解析外部来源的数据。
+    """
+    codec = detect(raw)
+    if codec == PRETTY:
+        return _json_loads(raw.lstrip(b"\xef\xbb\xbf") or b"{}"), codec
+    body = raw[HEADER_SIZE:]
+    if codec == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("记忆数据为 msgpack 格式，但未安装 msgpack")
+        return msgpack.unpackb(body, raw=False, strict_map_key=False), codec
+    if codec == "marshal":
+        return marshal.loads(body), codec
+    return _json_loads(body), codec
+
+
+def read_file(path: str) -> Tuple[Any, str]:
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+
+class _JsonStreamReader:
+    """在分块读入的文本上逐个解析 JSON 值，缓冲区只保留尚未解析的部分"""
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: int) -> bool:
+        chunk = self.f.read(size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """跳过空白，返回下一个字符 (文件结束时为空串)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill(STREAM_CHUNK):
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"记忆数据格式错误: 期望 {chars!r}，实际为 {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        size = STREAM_CHUNK
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # 数字等值在缓冲区末尾可能被截断，之后还有字符或已到文件末尾才算完整
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # 值尚不完整，读入更多内容；读入量随缓冲区翻倍，避免大值被反复重新解析
+            self._fill(max(size, len(self.buf)))
+            size *= 2
+
+
+def _iter_json_items(path: str, offset: int) -> Iterator[Tuple[Any, Any]]:
+    with open(path, "rb") as raw:
+        raw.seek(offset)
+        reader = _JsonStreamReader(io.TextIOWrapper(raw, encoding="utf-8-sig"))
+        if not reader.peek():
+            return
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            yield key, reader.value()
+            if reader.expect(",}") == "}":
+                return
+
+
+def _iter_decoded_items(path: str) -> Iterator[Tuple[Any, Any]]:
+    data, _ = read_file(path)
+    for key in list(data):
+        yield key, data.pop(key)
+
+
+def iter_file_items(path: str) -> Tuple[str, Iterator[Tuple[Any, Any]]]:
+    """逐个产出文件顶层对象的键值对，返回 (编码格式, 迭代器)
+
+    较大的 JSON 文件 (含旧版无文件头的文件) 增量解析，解析出的会话可以立即转换并释放；
+    其他情况整体解码后逐个弹出。格式错误在迭代过程中以异常抛出，此前产出的键值对仍然有效。
+    """
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SIZE)
+    fmt = detect(head)
+    if fmt in (PRETTY, "json") and os.path.getsize(path) > STREAM_THRESHOLD:
+        return fmt, _iter_json_items(path, 0 if fmt == PRETTY else HEADER_SIZE)
+    return fmt, _iter_decoded_items(path)
+
+
+if __name__ == "__main__":
+    # 调试用：将任意格式的记忆文件转为可读的 JSON，例如 python codec.py memory_data.json > dump.json
+    import sys
+    data, _ = read_file(sys.argv[1])
+    sys.stdout.write(encode(data, PRETTY).decode("utf-8") + "\n")
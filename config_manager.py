@@ -77,6 +77,266 @@ class ConfigManager:
             else:
                 validated["allowed_groups"] = self.default_config.get("allowed_groups", "")
         
+        # 验证写回保存开关
+        if "write_behind_enabled" in config:
+            write_behind = config["write_behind_enabled"]
+            if isinstance(write_behind, bool):
+                validated["write_behind_enabled"] = write_behind
+            else:
+                logger.warning(f"无效的write_behind_enabled值: {write_behind}，使用默认值")
+                validated["write_behind_enabled"] = self.default_config.get("write_behind_enabled", False)
+        
+        # 验证保存间隔 (即最大数据丢失窗口)
+        if "save_interval_seconds" in config:
+            interval = config["save_interval_seconds"]
+            if isinstance(interval, int) and 1 <= interval <= 300:
+                validated["save_interval_seconds"] = interval
+            else:
+                logger.warning(f"无效的save_interval_seconds值: {interval}，使用默认值")
+                validated["save_interval_seconds"] = self.default_config.get("save_interval_seconds", 5)
+        
+        # 验证触发保存的最大累计变更数
+        if "save_max_pending" in config:
+            max_pending = config["save_max_pending"]
+            if isinstance(max_pending, int) and 1 <= max_pending <= 1000:
+                validated["save_max_pending"] = max_pending
+            else:
+                logger.warning(f"无效的save_max_pending值: {max_pending}，使用默认值")
+                validated["save_max_pending"] = self.default_config.get("save_max_pending", 20)
+        
+        # 验证存储模式
+        if "storage_mode" in config:
+            mode = config["storage_mode"]
+            if mode in ("snapshot", "journal", "sqlite", "sharded"):
+                validated["storage_mode"] = mode
+            else:
+                logger.warning(f"无效的storage_mode值: {mode}，使用默认值")
+                validated["storage_mode"] = self.default_config.get("storage_mode", "snapshot")
+        
+        # 验证快照编码格式
+        if "snapshot_codec" in config:
+            snapshot_codec = config["snapshot_codec"]
+            if snapshot_codec in ("json", "msgpack", "marshal", "json_pretty"):
+                validated["snapshot_codec"] = snapshot_codec
+            else:
+                logger.warning(f"无效的snapshot_codec值: {snapshot_codec}，使用默认值")
+                validated["snapshot_codec"] = self.default_config.get("snapshot_codec", "json")
+        
+        # 验证常驻会话上限
+        if "max_resident_sessions" in config:
+            max_resident = config["max_resident_sessions"]
+            if isinstance(max_resident, int) and 0 <= max_resident <= 100000:
+                validated["max_resident_sessions"] = max_resident
+            else:
+                logger.warning(f"无效的max_resident_sessions值: {max_resident}，使用默认值")
+                validated["max_resident_sessions"] = self.default_config.get("max_resident_sessions", 200)
+        
+        # 验证归档区容量
+        if "archive_max_memories" in config:
+            archive_max = config["archive_max_memories"]
+            if isinstance(archive_max, int) and 0 <= archive_max <= 100000:
+                validated["archive_max_memories"] = archive_max
+            else:
+                logger.warning(f"无效的archive_max_memories值: {archive_max}，使用默认值")
+                validated["archive_max_memories"] = self.default_config.get("archive_max_memories", 1000)
+        
+        # 验证闲置归档天数
+        if "archive_idle_days" in config:
+            idle_days = config["archive_idle_days"]
+            if isinstance(idle_days, int) and 0 <= idle_days <= 3650:
+                validated["archive_idle_days"] = idle_days
+            else:
+                logger.warning(f"无效的archive_idle_days值: {idle_days}，使用默认值")
+                validated["archive_idle_days"] = self.default_config.get("archive_idle_days", 0)
+        
+        # 验证维护间隔
+        if "maintenance_interval_seconds" in config:
+            interval = config["maintenance_interval_seconds"]
+            if isinstance(interval, int) and 0 <= interval <= 86400:
+                validated["maintenance_interval_seconds"] = interval
+            else:
+                logger.warning(f"无效的maintenance_interval_seconds值: {interval}，使用默认值")
+                validated["maintenance_interval_seconds"] = self.default_config.get("maintenance_interval_seconds", 60)
+        
+        # 验证每批维护会话数
+        if "maintenance_batch_sessions" in config:
+            batch_sessions = config["maintenance_batch_sessions"]
+            if isinstance(batch_sessions, int) and 1 <= batch_sessions <= 1000:
+                validated["maintenance_batch_sessions"] = batch_sessions
+            else:
+                logger.warning(f"无效的maintenance_batch_sessions值: {batch_sessions}，使用默认值")
+                validated["maintenance_batch_sessions"] = self.default_config.get("maintenance_batch_sessions", 20)
+        
+        # 验证重要性衰减周期
+        if "importance_decay_days" in config:
+            decay_days = config["importance_decay_days"]
+            if isinstance(decay_days, int) and 0 <= decay_days <= 3650:
+                validated["importance_decay_days"] = decay_days
+            else:
+                logger.warning(f"无效的importance_decay_days值: {decay_days}，使用默认值")
+                validated["importance_decay_days"] = self.default_config.get("importance_decay_days", 0)
+        
+        # 验证记忆有效期
+        if "memory_ttl_days" in config:
+            ttl_days = config["memory_ttl_days"]
+            if isinstance(ttl_days, int) and 0 <= ttl_days <= 36500:
+                validated["memory_ttl_days"] = ttl_days
+            else:
+                logger.warning(f"无效的memory_ttl_days值: {ttl_days}，使用默认值")
+                validated["memory_ttl_days"] = self.default_config.get("memory_ttl_days", 0)
+        
+        # 验证列表分页大小
+        if "list_page_size" in config:
+            page_size = config["list_page_size"]
+            if isinstance(page_size, int) and 1 <= page_size <= 100:
+                validated["list_page_size"] = page_size
+            else:
+                logger.warning(f"无效的list_page_size值: {page_size}，使用默认值")
+                validated["list_page_size"] = self.default_config.get("list_page_size", 20)
+        
+        # 验证日志合并阈值
+        if "journal_compact_kb" in config:
+            compact_kb = config["journal_compact_kb"]
+            if isinstance(compact_kb, int) and 16 <= compact_kb <= 102400:
+                validated["journal_compact_kb"] = compact_kb
+            else:
+                logger.warning(f"无效的journal_compact_kb值: {compact_kb}，使用默认值")
+                validated["journal_compact_kb"] = self.default_config.get("journal_compact_kb", 1024)
+        
+        # 验证淘汰策略
+        if "eviction_policy" in config:
+            policy = config["eviction_policy"]
+            if policy in ("importance", "lru", "importance_decay"):
+                validated["eviction_policy"] = policy
+            else:
+                logger.warning(f"无效的eviction_policy值: {policy}，使用默认值")
+                validated["eviction_policy"] = self.default_config.get("eviction_policy", "importance")
+        
+        # 验证淘汰衰减周期
+        if "eviction_decay_days" in config:
+            decay_days = config["eviction_decay_days"]
+            if isinstance(decay_days, int) and 1 <= decay_days <= 365:
+                validated["eviction_decay_days"] = decay_days
+            else:
+                logger.warning(f"无效的eviction_decay_days值: {decay_days}，使用默认值")
+                validated["eviction_decay_days"] = self.default_config.get("eviction_decay_days", 7)
+        
+        # 验证去重相似度阈值
+        if "dedup_similarity" in config:
+            similarity = config["dedup_similarity"]
+            if isinstance(similarity, (int, float)) and not isinstance(similarity, bool) and 0.5 <= similarity <= 1:
+                validated["dedup_similarity"] = float(similarity)
+            else:
+                logger.warning(f"无效的dedup_similarity值: {similarity}，使用默认值")
+                validated["dedup_similarity"] = self.default_config.get("dedup_similarity", 0.8)
+        
+        # 验证精选结果缓存容量
+        if "rerank_cache_size" in config:
+            cache_size = config["rerank_cache_size"]
+            if isinstance(cache_size, int) and 0 <= cache_size <= 10000:
+                validated["rerank_cache_size"] = cache_size
+            else:
+                logger.warning(f"无效的rerank_cache_size值: {cache_size}，使用默认值")
+                validated["rerank_cache_size"] = self.default_config.get("rerank_cache_size", 256)
+        
+        # 验证精选结果缓存有效期
+        if "rerank_cache_ttl" in config:
+            cache_ttl = config["rerank_cache_ttl"]
+            if isinstance(cache_ttl, int) and 1 <= cache_ttl <= 86400:
+                validated["rerank_cache_ttl"] = cache_ttl
+            else:
+                logger.warning(f"无效的rerank_cache_ttl值: {cache_ttl}，使用默认值")
+                validated["rerank_cache_ttl"] = self.default_config.get("rerank_cache_ttl", 600)
+        
+        # 验证精选时间预算
+        if "rerank_timeout_ms" in config:
+            timeout_ms = config["rerank_timeout_ms"]
+            if isinstance(timeout_ms, int) and 100 <= timeout_ms <= 60000:
+                validated["rerank_timeout_ms"] = timeout_ms
+            else:
+                logger.warning(f"无效的rerank_timeout_ms值: {timeout_ms}，使用默认值")
+                validated["rerank_timeout_ms"] = self.default_config.get("rerank_timeout_ms", 5000)
+        
+        # 验证精选最大并发数
+        if "rerank_max_concurrency" in config:
+            concurrency = config["rerank_max_concurrency"]
+            if isinstance(concurrency, int) and 1 <= concurrency <= 64:
+                validated["rerank_max_concurrency"] = concurrency
+            else:
+                logger.warning(f"无效的rerank_max_concurrency值: {concurrency}，使用默认值")
+                validated["rerank_max_concurrency"] = self.default_config.get("rerank_max_concurrency", 4)
+        
+        # 验证熔断失败阈值
+        if "rerank_breaker_threshold" in config:
+            threshold = config["rerank_breaker_threshold"]
+            if isinstance(threshold, int) and 1 <= threshold <= 100:
+                validated["rerank_breaker_threshold"] = threshold
+            else:
+                logger.warning(f"无效的rerank_breaker_threshold值: {threshold}，使用默认值")
+                validated["rerank_breaker_threshold"] = self.default_config.get("rerank_breaker_threshold", 3)
+        
+        # 验证熔断冷却时间
+        if "rerank_breaker_cooldown" in config:
+            cooldown = config["rerank_breaker_cooldown"]
+            if isinstance(cooldown, int) and 1 <= cooldown <= 3600:
+                validated["rerank_breaker_cooldown"] = cooldown
+            else:
+                logger.warning(f"无效的rerank_breaker_cooldown值: {cooldown}，使用默认值")
+                validated["rerank_breaker_cooldown"] = self.default_config.get("rerank_breaker_cooldown", 60)
+        
+        # 验证精选批处理窗口
+        if "rerank_batch_window_ms" in config:
+            window_ms = config["rerank_batch_window_ms"]
+            if isinstance(window_ms, int) and 0 <= window_ms <= 2000:
+                validated["rerank_batch_window_ms"] = window_ms
+            else:
+                logger.warning(f"无效的rerank_batch_window_ms值: {window_ms}，使用默认值")
+                validated["rerank_batch_window_ms"] = self.default_config.get("rerank_batch_window_ms", 0)
+        
+        # 验证单批最大请求数
+        if "rerank_batch_max_jobs" in config:
+            max_jobs = config["rerank_batch_max_jobs"]
+            if isinstance(max_jobs, int) and 2 <= max_jobs <= 32:
+                validated["rerank_batch_max_jobs"] = max_jobs
+            else:
+                logger.warning(f"无效的rerank_batch_max_jobs值: {max_jobs}，使用默认值")
+                validated["rerank_batch_max_jobs"] = self.default_config.get("rerank_batch_max_jobs", 8)
+        
+        # 验证注入标题与引导指令 (注入模板随之重建)
+        if "injection_title" in config:
+            title = config["injection_title"]
+            if isinstance(title, str):
+                validated["injection_title"] = title
+            else:
+                logger.warning(f"无效的injection_title值: {title}，使用默认值")
+                validated["injection_title"] = self.default_config.get("injection_title", "核心背景事实")
+        
+        if "injection_instruction" in config:
+            instruction = config["injection_instruction"]
+            if isinstance(instruction, str):
+                validated["injection_instruction"] = instruction
+            else:
+                logger.warning(f"无效的injection_instruction值: {instruction}，使用默认值")
+                validated["injection_instruction"] = self.default_config.get("injection_instruction", "")
+        
+        # 验证注入 token 预算
+        if "injection_token_budget" in config:
+            token_budget = config["injection_token_budget"]
+            if isinstance(token_budget, int) and 0 <= token_budget <= 32000:
+                validated["injection_token_budget"] = token_budget
+            else:
+                logger.warning(f"无效的injection_token_budget值: {token_budget}，使用默认值")
+                validated["injection_token_budget"] = self.default_config.get("injection_token_budget", 800)
+        
+        # 验证评分引擎
+        if "scoring_engine" in config:
+            engine = config["scoring_engine"]
+            if engine in ("bigram", "bm25"):
+                validated["scoring_engine"] = engine
+            else:
+                logger.warning(f"无效的scoring_engine值: {engine}，使用默认值")
+                validated["scoring_engine"] = self.default_config.get("scoring_engine", "bigram")
+        
         return validated
     
     def get_config(self) -> Dict[str, Any]:
@@ -97,8 +357,11 @@ class ConfigManager:
         """获取配置摘要"""
         config = self.current_config
         summary = "📋 当前配置：\n"
-        summary += f"• 最大记忆数: {config.get('max_memories', 10)}\n"
+        summary += f"• 最大记忆数: {config.get('max_memories', 10)} (归档区 {config.get('archive_max_memories', 1000)})\n"
         summary += f"• 自动保存: {'启用' if config.get('auto_save_enabled', True) else '禁用'}\n"
         summary += f"• 重要性阈值: {config.get('importance_threshold', 3)}/5\n"
-        summary += f"• 记忆管理: {'启用' if config.get('enable_memory_management', True) else '禁用'}"
+        summary += f"• 记忆管理: {'启用' if config.get('enable_memory_management', True) else '禁用'}\n"
+        summary += f"• 写回保存: {'启用' if config.get('write_behind_enabled', False) else '禁用'} (间隔 {config.get('save_interval_seconds', 5)}s)\n"
+        summary += f"• 存储模式: {config.get('storage_mode', 'snapshot')}\n"
+        summary += f"• 淘汰策略: {config.get('eviction_policy', 'importance')}"
         return summary 
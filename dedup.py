@@ -0,0 +1,194 @@
+import re
+import random
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，缺失时逐个排列用纯 Python 计算签名
+    np = None
+
+# 记忆内容开头的身份标签，如 "[昵称(QQ) 提到]: "
+TAG_PATTERN = re.compile(r"^\[[^\]]*提到\]:\s*")
+# 非字母数字字符 (\w 即 str.isalnum() 加下划线)
+_NON_ALNUM = re.compile(r"[\W_]+")
+
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# multiply-shift 哈希族: h -> ((a * h + b) mod 2^64) >> 32 (a 为奇数)，只需 64 位乘加，可整体向量化
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(20240601)
+_HASH_A = [_rng.getrandbits(64) | 1 for _ in range(NUM_PERM)]
+_HASH_B = [_rng.getrandbits(64) for _ in range(NUM_PERM)]
+if np is not None:
+    _NP_A = np.array(_HASH_A, dtype=np.uint64)[:, None]
+    _NP_B = np.array(_HASH_B, dtype=np.uint64)[:, None]
+    _NP_SHIFT = np.uint64(32)
+# 批量计算签名时每批最多的 shingle 数，限制中间矩阵 (NUM_PERM x 批大小) 的内存
+_BATCH_SHINGLES = 32768
+
+
+def strip_tag(content: str) -> str:
+    """去掉身份标签，只保留记忆正文"""
+    return TAG_PATTERN.sub("", content, count=1)
+
+
+def normalize(text: str) -> str:
+    """小写并只保留字母数字，忽略标点与空白差异"""
+    return _NON_ALNUM.sub("", text.lower())
+
+
+def shingles(text: str, n: int = 3) -> Set[str]:
+    """字符 n-gram 集合"""
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+
+def minhash(shingle_set: Set[str]) -> Tuple[int, ...]:
+    """计算 MinHash 签名"""
+    if np is not None:
+        # hash() 的结果在有符号 64 位范围内，按位重解释为无符号即等于 & _MASK64
+        hashes = np.array([hash(s) for s in shingle_set], dtype=np.int64).view(np.uint64)
+        return tuple(((_NP_A * hashes + _NP_B) >> _NP_SHIFT).min(axis=1).tolist())
+    hashes = [hash(s) & _MASK64 for s in shingle_set]
+    return tuple(min(((a * h + b) & _MASK64) >> 32 for h in hashes) for a, b in zip(_HASH_A, _HASH_B))
+
+
+def minhash_many(shingle_sets: List[Set[str]]) -> List[Tuple[int, ...]]:
+    """批量计算签名 (空集合的签名为空元组)
+
+    有 numpy 时把一批记忆的 shingle 哈希拼接起来一次完成全部排列，再按记忆分段取最小值。
+    """
+    if np is None:
+        return [minhash(shingle_set) if shingle_set else () for shingle_set in shingle_sets]
+    signatures: List[Tuple[int, ...]] = [()] * len(shingle_sets)
+    batch: List[int] = []
+    size = 0
+    for i, shingle_set in enumerate(shingle_sets):
+        if shingle_set:
+            batch.append(i)
+            size += len(shingle_set)
+        if batch and (size >= _BATCH_SHINGLES or i == len(shingle_sets) - 1):
+            lengths = [len(shingle_sets[j]) for j in batch]
+            hashes = np.array([hash(x) for j in batch for x in shingle_sets[j]], dtype=np.int64).view(np.uint64)
+            starts = np.cumsum([0] + lengths[:-1])
+            values = np.minimum.reduceat((_NP_A * hashes + _NP_B) >> _NP_SHIFT, starts, axis=1)
+            for j, signature in zip(batch, values.T.tolist()):
+                signatures[j] = tuple(signature)
+            batch, size = [], 0
+    return signatures
+
+
+class DedupIndex:
+    """单个会话的去重索引
+
+    完整内容走哈希精确查找；去掉身份标签后的正文计算 MinHash 签名并按 LSH 分桶，
+    新内容只与同桶的候选比较，因此查重代价与会话记忆数量基本无关。
+    """
+
+    def __init__(self, memories: List[Dict] = None, threshold: float = 0.8):
+        self.threshold = threshold
+        # 完整内容 -> {id(memory)}
+        self._exact: Dict[str, Set[int]] = {}
+        # id(memory) -> (memory, 入索引时的完整内容, 正文 shingles, 签名, 规范化正文)
+        self._docs: Dict[int, Tuple[Dict, str, Set[str], Tuple[int, ...], str]] = {}
+        # (band, 分段签名) -> {id(memory)}
+        self._buckets: Dict[Tuple, Set[int]] = {}
+        if memories:
+            # 整个会话的签名批量计算
+            contents = [memory["content"] for memory in memories]
+            texts = [normalize(strip_tag(content)) for content in contents]
+            shingle_sets = [shingles(text) for text in texts]
+            for memory, content, text, shingle_set, signature in zip(
+                    memories, contents, texts, shingle_sets, minhash_many(shingle_sets)):
+                self._insert(memory, content, text, shingle_set, signature)
+
+    @staticmethod
+    def _bands(signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield (band, signature[band * ROWS:(band + 1) * ROWS])
+
+    @staticmethod
+    def _features(content: str):
+        text = normalize(strip_tag(content))
+        shingle_set = shingles(text)
+        return text, shingle_set, minhash(shingle_set) if shingle_set else ()
+
+    def add(self, memory: Dict):
+        key = id(memory)
+        if key in self._docs:
+            self.remove(memory)
+        content = memory["content"]
+        text, shingle_set, signature = self._features(content)
+        self._insert(memory, content, text, shingle_set, signature)
+
+    def _insert(self, memory: Dict, content: str, text: str, shingle_set: Set[str], signature: Tuple[int, ...]):
+        key = id(memory)
+        self._docs[key] = (memory, content, shingle_set, signature, text)
+        self._exact.setdefault(content, set()).add(key)
+        if signature:
+            buckets = self._buckets
+            for band in range(BANDS):
+                bucket = (band, signature[band * ROWS:(band + 1) * ROWS])
+                members = buckets.get(bucket)
+                if members is None:
+                    buckets[bucket] = {key}
+                else:
+                    members.add(key)
+
+    def remove(self, memory: Dict):
+        key = id(memory)
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        _, content, _, signature, _ = doc
+        exact = self._exact.get(content)
+        if exact is not None:
+            exact.discard(key)
+            if not exact:
+                del self._exact[content]
+        if signature:
+            for bucket in self._bands(signature):
+                members = self._buckets.get(bucket)
+                if members is None:
+                    continue
+                members.discard(key)
+                if not members:
+                    del self._buckets[bucket]
+
+    def update(self, memory: Dict):
+        """记忆内容变更后刷新索引"""
+        self.remove(memory)
+        self.add(memory)
+
+    def find(self, content: str) -> Optional[Dict]:
+        """查找与 content 重复或高度相似的已有记忆
+
+        相似度取正文 shingle 的 Jaccard 系数与"新内容被已有内容包含的比例"中的较大者
+        (后者仅对正文长于 10 个字符的内容)。只比较 LSH 同桶的候选，短内容被长内容原样包含的情况
+        由调用方经倒排索引另行检查。
+        """
+        exact = self._exact.get(content)
+        if exact:
+            return self._docs[next(iter(exact))][0]
+
+        text, shingle_set, signature = self._features(content)
+        if not signature:
+            return None
+        candidates = set()
+        for bucket in self._bands(signature):
+            candidates |= self._buckets.get(bucket, set())
+
+        best, best_score = None, 0.0
+        for key in candidates:
+            memory, _, other, _, other_text = self._docs[key]
+            if text == other_text:
+                return memory
+            overlap = len(shingle_set & other)
+            score = overlap / len(shingle_set | other)
+            if len(text) > 10:
+                score = max(score, overlap / len(shingle_set))
+            if score >= self.threshold and score > best_score:
+                best, best_score = memory, score
+        return best
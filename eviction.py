@@ -0,0 +1,76 @@
+import heapq
+import itertools
+import math
+from typing import Dict, List, Optional, Tuple
+
+EVICTION_POLICIES = ("importance", "lru", "importance_decay")
+
+
+def eviction_key(memory: Dict, policy: str, decay_seconds: float) -> Tuple:
+    """计算记忆的淘汰键，键越小越先被淘汰
+
+    所有策略的键都与当前时间无关 (衰减以"最近使用时间 / 衰减周期"计入)，
+    因此记忆入堆后无需随时间重新计算。
+    """
+    epoch = memory.get("epoch", 0)
+    last_used = max(epoch, memory.get("last_hit", 0))
+    if policy == "lru":
+        return (last_used,)
+    if policy == "importance_decay":
+        # 每过一个衰减周期相当于重要性降低 1 级，被召回的次数按对数加成
+        return (memory["importance"] + math.log1p(memory.get("hits", 0)) + last_used / decay_seconds,)
+    return (memory["importance"], epoch)
+
+
+class EvictionHeap:
+    """单个会话的淘汰最小堆 (惰性删除)
+
+    记忆的键变化时重新入堆，旧条目在弹出时按令牌识别并丢弃；
+    淘汰只弹出堆顶，不会改变会话列表的顺序。
+    """
+
+    def __init__(self, memories: List[Dict], policy: str = "importance", decay_days: int = 7):
+        self.policy = policy
+        self.decay_days = decay_days
+        self._decay_seconds = max(decay_days, 1) * 86400
+        self._heap: List[Tuple] = []
+        # id(memory) -> (令牌, memory)
+        self._entries: Dict[int, Tuple[int, Dict]] = {}
+        self._counter = itertools.count()
+        for memory in memories:
+            self.push(memory)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, memory: Dict) -> Tuple:
+        """记忆在当前策略下的淘汰键"""
+        return eviction_key(memory, self.policy, self._decay_seconds)
+
+    def push(self, memory: Dict):
+        """加入记忆，或在其重要性/使用情况变化后更新键"""
+        token = next(self._counter)
+        self._entries[id(memory)] = (token, memory)
+        heapq.heappush(self._heap, (self.key(memory), token, id(memory)))
+        if len(self._heap) > 2 * len(self._entries) + 32:
+            self._rebuild()
+
+    def discard(self, memory: Dict):
+        """移除记忆 (堆中的旧条目稍后惰性丢弃)"""
+        self._entries.pop(id(memory), None)
+
+    def pop(self) -> Optional[Dict]:
+        """弹出并返回最应被淘汰的记忆"""
+        while self._heap:
+            _, token, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == token:
+                del self._entries[key]
+                return entry[1]
+        return None
+
+    def _rebuild(self):
+        """丢弃所有过期条目，重建堆"""
+        self._heap = [(self.key(m), token, key)
+                      for key, (token, m) in self._entries.items()]
+        heapq.heapify(self._heap)
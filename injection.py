@@ -0,0 +1,87 @@
+import re
+from typing import Dict, List, Tuple
+
+# 中日韩文字、假名、谚文与全角标点大致每字 1 个 token，其余文本大致每 4 个字符 1 个 token
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数 (不依赖分词器，偏保守)"""
+    rest = _CJK_RE.sub("", text)
+    return len(text) - len(rest) + (len(rest) + 3) // 4
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """截断文本使估算 token 数不超过 budget (含省略号)"""
+    if estimate_tokens(text) <= budget:
+        return text
+    budget -= estimate_tokens(ELLIPSIS)
+    if budget <= 0:
+        return ""
+    # 估算值随长度单调增加，二分查找最长可保留的前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + ELLIPSIS if low else ""
+
+
+class InjectionTemplate:
+    """注入区块模板
+
+    标题与指令在配置加载/更新时渲染一次并计算 token 数，每次请求只需拼接记忆行。
+    """
+
+    def __init__(self, title: str, instruction: str):
+        self.header = f"\n\n{'=' * 15} {title} {'=' * 15}\n{instruction}\n"
+        self.footer = f"\n{'=' * 46}\n\n"
+        self.overhead = estimate_tokens(self.header) + estimate_tokens(self.footer)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "InjectionTemplate":
+        return cls(config.get("injection_title", "核心背景事实"),
+                   config.get("injection_instruction", "注意：以下是你记录的与当前话题相关的真实记忆。请参考时间戳判断时效性，并优先比对记录中的 QQ 号以区分你本人的真实设定与他人的言论或误导："))
+
+    @staticmethod
+    def line_prefix(memory: Dict) -> str:
+        return f"- [时间:{memory['timestamp']}] "
+
+    def render(self, lines: List[str]) -> str:
+        return self.header + "\n".join(lines) + self.footer
+
+    def pack(self, weighted: List[Tuple[float, Dict]], budget: int) -> Tuple[List[Dict], List[str], int]:
+        """在 token 预算内挑选记忆，返回 (入选记忆, 渲染后的记忆行, 被截断的条数)
+
+        weighted 为按优先级排列的 (权重, 记忆)。按"权重 / token 数"从高到低贪心装入，
+        最优先的记忆单独也放不下时截断其内容；入选记忆保持原有优先级顺序输出。
+        budget 为 0 时不限制。
+        """
+        lines = [self.line_prefix(m) + m["content"] for _, m in weighted]
+        if budget <= 0:
+            return [m for _, m in weighted], lines, 0
+
+        remaining = budget - self.overhead
+        costs = [estimate_tokens(line) + 1 for line in lines]  # +1 为换行
+        order = sorted(range(len(weighted)), key=lambda i: weighted[i][0] / costs[i], reverse=True)
+        chosen = set()
+        for i in order:
+            if costs[i] <= remaining:
+                chosen.add(i)
+                remaining -= costs[i]
+
+        truncated = 0
+        if not chosen and weighted and remaining > 0:
+            memory = weighted[0][1]
+            prefix = self.line_prefix(memory)
+            content = truncate_to_tokens(memory["content"], remaining - 1 - estimate_tokens(prefix))
+            if content:
+                lines[0] = prefix + content
+                chosen.add(0)
+                truncated = 1
+
+        selected = sorted(chosen)
+        return [weighted[i][1] for i in selected], [lines[i] for i in selected], truncated
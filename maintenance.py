@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("astrbot")
+
+
+class MaintenanceScheduler:
+    """后台维护任务
+
+    每隔 maintenance_interval_seconds 秒处理一小批会话 (maintenance_batch_sessions 个)：
+    重要性衰减、过期删除、闲置归档与移除空会话，会话之间让出事件循环；
+    遍历完全部会话后整理一次存储 (合并日志、回收空间等)。
+    这些工作因此不会落在用户请求的处理路径上，单次耗时也有上限。
+    """
+
+    def __init__(self, memory_manager, config: dict):
+        self.memory_manager = memory_manager
+        self.config = config
+        self._task: Optional[asyncio.Task] = None
+        # 本轮待处理的会话 (每轮开始时取一次会话列表)
+        self._pending: List[str] = []
+        self._pass_stats: Dict[str, int] = {}
+
+    def start(self):
+        """启动后台任务；尚无运行中的事件循环时不启动，由 ensure_started 补启动"""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        except RuntimeError:
+            self._task = None
+
+    def ensure_started(self):
+        if self._task is None:
+            self.start()
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            interval = self.config.get("maintenance_interval_seconds", 60)
+            # 间隔为 0 时暂停维护，仍定期检查配置以便热更新后恢复
+            await asyncio.sleep(interval if interval > 0 else 60)
+            if interval <= 0:
+                continue
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"记忆后台维护失败: {e}")
+
+    async def tick(self) -> Dict[str, int]:
+        """处理一批会话，返回本批各项处理条数；一轮结束时整理存储"""
+        manager = self.memory_manager
+        if not manager.ready:
+            return {}
+        if not self._pending:
+            self._pending = manager.session_ids(include_archive=True)
+            self._pass_stats = {}
+        batch_size = self.config.get("maintenance_batch_sessions", 20)
+        batch, self._pending = self._pending[:batch_size], self._pending[batch_size:]
+
+        start = time.perf_counter()
+        now = time.time()
+        totals: Dict[str, int] = {}
+        for session_id in batch:
+            for key, count in manager.maintain_session(session_id, now).items():
+                totals[key] = totals.get(key, 0) + count
+            await asyncio.sleep(0)
+        manager.perf.record("maintenance", time.perf_counter() - start)
+
+        changed = sum(totals.values())
+        for key, count in totals.items():
+            self._pass_stats[key] = self._pass_stats.get(key, 0) + count
+            if count:
+                manager.perf.incr(f"maintenance_{key}", count)
+        if changed:
+            await manager.schedule_save()
+
+        if not self._pending:
+            await manager.maintain_storage()
+            if any(self._pass_stats.values()):
+                logger.info(f"记忆后台维护完成一轮: 过期删除 {self._pass_stats.get('expired', 0)} 条，"
+                            f"重要性衰减 {self._pass_stats.get('decayed', 0)} 条，"
+                            f"闲置归档 {self._pass_stats.get('archived', 0)} 条，"
+                            f"移除空会话 {self._pass_stats.get('dropped', 0)} 个")
+        return totals
@@ -0,0 +1,150 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+
+def iter_bigrams(text: str):
+    """遍历文本中的所有相邻双字 (bigram)"""
+    for i in range(len(text) - 1):
+        yield text[i:i+2]
+
+
+class SessionIndex:
+    """单个会话的增量倒排索引 (bigram -> 记忆)
+
+    记忆以对象身份 (id) 作为键，索引内部持有记忆引用，因此在记忆被移除前 id 不会被复用。
+    """
+
+    def __init__(self, memories: List[Dict] = None):
+        # id(memory) -> (memory, 小写内容)
+        self._docs: Dict[int, Tuple[Dict, str]] = {}
+        # bigram -> {id(memory)}
+        self._postings: Dict[str, Set[int]] = {}
+        for memory in memories or []:
+            self.add(memory)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, memory: Dict):
+        """将记忆加入索引"""
+        key = id(memory)
+        if key in self._docs:
+            self.remove(memory)
+        content = memory["content"].lower()
+        self._docs[key] = (memory, content)
+        for bigram in set(iter_bigrams(content)):
+            self._postings.setdefault(bigram, set()).add(key)
+
+    def remove(self, memory: Dict):
+        """将记忆移出索引"""
+        key = id(memory)
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for bigram in set(iter_bigrams(doc[1])):
+            postings = self._postings.get(bigram)
+            if postings is None:
+                continue
+            postings.discard(key)
+            if not postings:
+                del self._postings[bigram]
+
+    def update(self, memory: Dict):
+        """记忆内容变更后刷新索引"""
+        self.remove(memory)
+        self.add(memory)
+
+    def lowered(self, memory: Dict) -> str:
+        """返回缓存的小写内容"""
+        doc = self._docs.get(id(memory))
+        return doc[1] if doc else memory["content"].lower()
+
+    def match(self, clean_query: str) -> List[Tuple[Dict, int]]:
+        """返回与查询至少共享一个 bigram 的记忆及其匹配得分
+
+        评分规则与原逐条扫描一致：整句包含 +40，否则每个命中的 bigram +15；
+        单字查询命中 +25。
+        """
+        results = []
+        if len(clean_query) == 1:
+            # 单字查询没有 bigram 可用，直接扫描缓存的小写内容
+            for memory, content in self._docs.values():
+                if clean_query in content:
+                    results.append((memory, 25))
+            return results
+        if len(clean_query) < 2:
+            return results
+
+        query_bigrams = set(iter_bigrams(clean_query))
+        hits: Dict[int, int] = {}
+        for bigram in query_bigrams:
+            for key in self._postings.get(bigram, ()):
+                hits[key] = hits.get(key, 0) + 1
+
+        for key, count in hits.items():
+            memory, content = self._docs[key]
+            # 只有全部 bigram 都命中时，查询才可能是内容的子串
+            if (count == len(query_bigrams) and clean_query in content) or \
+                    (len(content) <= len(clean_query) and content in clean_query):
+                results.append((memory, 40))
+            else:
+                results.append((memory, count * 15))
+        return results
+
+    def search(self, keyword: str) -> Set[int]:
+        """返回可能包含关键词的记忆 id 集合 (关键词需已小写，调用方仍需做子串校验)"""
+        if len(keyword) < 2:
+            return set(self._docs)
+        candidates = None
+        for bigram in set(iter_bigrams(keyword)):
+            postings = self._postings.get(bigram)
+            if not postings:
+                return set()
+            candidates = set(postings) if candidates is None else candidates & postings
+        return candidates
+
+    def containing(self, text: str) -> Optional[Dict]:
+        """返回内容原样包含 text 的一条记忆 (区分大小写，与去重的包含规则一致)，没有时返回 None"""
+        for key in self.search(text.lower()):
+            memory = self._docs[key][0]
+            if text in memory["content"]:
+                return memory
+        return None
+
+
+class SessionSignatures:
+    """跨会话检索用的会话签名 (bigram 哈希位图)
+
+    每个会话只保存一个 SIGNATURE_BITS 位的整数，记录其全部记忆内容出现过的 bigram 的哈希位。
+    查询时用关键词的位掩码与各会话签名做一次按位与，即可排除绝大多数不可能命中的会话，
+    只对候选会话逐条校验；占用与会话数成正比，与记忆条数无关。
+    签名按会话版本号缓存，会话变化后由调用方重建。
+    """
+
+    SIGNATURE_BITS = 1 << 15
+
+    def __init__(self):
+        # 会话 -> (构建时的版本号, 签名)
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+
+    @classmethod
+    def mask(cls, texts) -> int:
+        """文本 (需已小写) 中全部 bigram 的哈希位图"""
+        bits = bytearray(cls.SIGNATURE_BITS // 8)
+        for text in texts:
+            for bigram in iter_bigrams(text):
+                h = hash(bigram) & (cls.SIGNATURE_BITS - 1)
+                bits[h >> 3] |= 1 << (h & 7)
+        return int.from_bytes(bits, "little")
+
+    def get(self, session_id: str, version: int) -> Optional[int]:
+        """版本号一致时返回缓存的签名"""
+        cached = self._signatures.get(session_id)
+        return cached[1] if cached is not None and cached[0] == version else None
+
+    def set(self, session_id: str, version: int, signature: int):
+        self._signatures[session_id] = (version, signature)
+
+    def retain(self, session_ids: Set[str]):
+        """丢弃已不存在的会话的签名"""
+        for session_id in self._signatures.keys() - session_ids:
+            del self._signatures[session_id]
@@ -1,110 +1,951 @@
+import asyncio
+import datetime
 import json
 import os
-import datetime
+import time
 import logging
-from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import List, Dict, Optional, Set, Tuple, Iterable, Iterator
+
+from .memory_index import SessionIndex, SessionSignatures
+from .eviction import EvictionHeap, EVICTION_POLICIES
+from .dedup import DedupIndex
+from .scoring import BM25Scorer, numpy_available
+from .perf import PerfRecorder
+from . import codec
+from .memory_record import MemoryRecord, TIMESTAMP_FORMAT
+from .storage import StorageBackend, JournalStorage, STORAGE_BACKENDS, apply_op
 
 logger = logging.getLogger("astrbot")
 
-@dataclass
-class Memory:
-    """记忆数据结构"""
-    content: str
-    importance: int
-    timestamp: str
-    session_id: str
-    memory_id: str
+# 归档区以保留前缀的独立会话存放，与热区共用存储、变更记录与按需加载
+ARCHIVE_PREFIX = "__archive__:"
+# 热区最高得分低于此值时才检索归档区：重要性与新鲜度加成最多 15 分，因此约等于热区最多只命中一个 bigram
+ARCHIVE_RECALL_THRESHOLD = 30
+# NDJSON 导入/导出：每次读写约这么多字节，单个会话每攒够这么多条就先导入一批
+TRANSFER_CHUNK = 1024 * 1024
+IMPORT_BATCH = 1000
+
+
+def archive_id(session_id: str) -> str:
+    """会话对应的归档区 ID"""
+    return ARCHIVE_PREFIX + session_id
+
+
+def is_archive(session_id: str) -> bool:
+    return session_id.startswith(ARCHIVE_PREFIX)
+
 
 class MemoryManager:
     """记忆管理器"""
     
-    def __init__(self, data_file: str, config: dict):
+    def __init__(self, data_file: str, config: dict, load: bool = True):
         self.data_file = data_file
         self.config = config
-        self.memories: Dict[str, List[Dict]] = {}
-        self._load_memories()
+        # 会话 -> 记忆记录列表 (MemoryRecord，支持字典式访问)
+        self.memories: Dict[str, List[MemoryRecord]] = {}
+        # 每个会话的倒排索引，首次检索时惰性构建
+        self._indexes: Dict[str, SessionIndex] = {}
+        # 每个会话的淘汰堆，首次淘汰时惰性构建
+        self._evictors: Dict[str, EvictionHeap] = {}
+        # 每个会话的去重索引，首次新增记忆时惰性构建
+        self._dedupers: Dict[str, DedupIndex] = {}
+        # 每个会话的记忆版本号，内容/重要性等变化时递增 (用于缓存失效)
+        self._versions: Dict[str, int] = {}
+        # BM25 打分器缓存: 会话 -> (构建时的版本号, 打分器)
+        self._scorers: Dict[str, Tuple[int, BM25Scorer]] = {}
+        # 按重要性排序的视图缓存: 会话 -> (构建时的版本号, 排序后的记忆)
+        self._sorted_views: Dict[str, Tuple[int, List[MemoryRecord]]] = {}
+        self._warned_no_numpy = False
+        # 写回 (write-behind) 状态：未落盘的变更数与延迟保存任务
+        self._pending_changes = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        # 尚未交给存储后端的变更记录 (日志模式下逐条追加)
+        self._ops: List[Dict] = []
+        self._storages: Dict[str, StorageBackend] = {}
+        # 最近一次成功写入的后端；切换后端后首次保存需整体写入
+        self._last_storage: Optional[StorageBackend] = None
+        # 保存串行化：同一时刻只有一次写盘，且按快照先后顺序完成
+        self._save_lock = asyncio.Lock()
+        # 有待落盘变更的会话 (与 _ops 同步) 及正在写入的会话，供判断会话能否卸载
+        self._dirty_sessions: Set[str] = set()
+        self._saving_sessions: Set[str] = set()
+        # 待落盘的命中记录：会话 -> {id(记忆): 记忆}。同一记忆的多次命中只保留最新值，保存时各折叠为一条 hit 变更
+        self._pending_hits: Dict[str, Dict[int, MemoryRecord]] = {}
+        # 加载/保存耗时与计数，插件主类也将请求各阶段耗时记录于此
+        self.perf = PerfRecorder()
+        # 惰性加载来源 (分片存储)：不在 self.memories 中的会话从这里按需读取；None 表示全部常驻
+        self._lazy_source: Optional[StorageBackend] = None
+        # 常驻会话的访问顺序 (LRU)，超过 max_resident_sessions 时卸载最久未访问的已落盘会话
+        self._resident: "OrderedDict[str, None]" = OrderedDict()
+        # 跨会话检索的会话签名，会话卸载后仍保留，避免重复读取分片
+        self._signatures = SessionSignatures()
+        # 是否已完成加载；加载前不读写记忆，也不保存 (避免空数据覆盖磁盘文件)
+        self._ready = False
+        # 加载中途出错 (且后端未能自行隔离损坏文件) 时置位：内存中只有部分数据，不再写入存储，以免覆盖原有数据
+        self._read_only = False
+        self._load_task: Optional[asyncio.Future] = None
+        if load:
+            self._load_memories()
+    
+    @property
+    def ready(self) -> bool:
+        return self._ready
+    
+    def start_loading(self):
+        """在后台线程加载记忆，不阻塞插件初始化；没有运行中的事件循环时同步加载"""
+        if self._ready or self._load_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._load_memories()
+            return
+        self._load_task = loop.create_task(asyncio.to_thread(self._load_memories))
+    
+    async def wait_ready(self):
+        """等待后台加载完成 (已加载时立即返回)"""
+        if self._ready:
+            return
+        if self._load_task is None:
+            self.start_loading()
+            if self._load_task is None:
+                return
+        # shield: 调用方被取消时不中断加载本身
+        await asyncio.shield(self._load_task)
+    
+    def _get_storage(self) -> StorageBackend:
+        """按 storage_mode 获取存储后端，运行中切换模式时也能无缝接续"""
+        mode = self.config.get("storage_mode", "snapshot")
+        if mode not in STORAGE_BACKENDS:
+            mode = "snapshot"
+        storage = self._storages.get(mode)
+        if storage is None:
+            storage = STORAGE_BACKENDS[mode](self.data_file)
+            self._storages[mode] = storage
+        storage.codec = self.config.get("snapshot_codec", "json")
+        if isinstance(storage, JournalStorage):
+            storage.compact_threshold = self.config.get("journal_compact_kb", 1024) * 1024
+        return storage
     
     def _load_memories(self):
         """加载记忆数据"""
-        if not os.path.exists(self.data_file):
-            with open(self.data_file, "w", encoding='utf-8') as f:
-                f.write("{}")
-        
+        storage = self._get_storage()
+        start = time.perf_counter()
+        self.memories = {}
+        self._read_only = False
+        migrated = 0
+        # 逐个会话读取并转换，大文件增量解析，解析出的字典随即释放，避免两份数据同时驻留
         try:
-            with open(self.data_file, "r", encoding='utf-8') as f:
-                self.memories = json.load(f)
+            for session_id, memories in storage.load_sessions():
+                self.memories[session_id], count = self._to_records(session_id, memories)
+                migrated += count
         except Exception as e:
-            logger.error(f"加载记忆数据失败: {e}")
-            self.memories = {}
+            logger.error(f"加载记忆数据失败，本次运行不再写入记忆存储以保护原有数据: {e}")
+            self._read_only = True
+        elapsed = time.perf_counter() - start
+        self.perf.record("load", elapsed)
+        loaded = sum(len(m) for m in self.memories.values())
+        self.perf.set("loaded_memories", loaded)
+        self._last_storage = storage
+        self._lazy_source = storage if storage.lazy else None
+        self._resident = OrderedDict((sid, None) for sid in self.memories)
+        self._ops = []
+        self._dirty_sessions = set()
+        self._pending_hits = {}
+        self._indexes = {}
+        self._evictors = {}
+        self._dedupers = {}
+        self._scorers = {}
+        self._sorted_views = {}
+        self._signatures = SessionSignatures()
+        if migrated:
+            logger.info(f"已为 {migrated} 条旧记忆补齐数值时间戳")
+        if storage.needs_rewrite() and not storage.quarantined:
+            logger.info(f"记忆数据为 {storage.loaded_codec} 格式，将在下次保存时转换为 {storage.codec} 格式")
+        if migrated or storage.needs_rewrite():
+            # 补齐的字段、格式转换与隔离损坏文件后读出的部分数据都不在变更记录中，下次保存时整体写入
+            self._last_storage = None
+            self._pending_changes += 1
+        self._ready = True
+        logger.info(f"记忆数据加载完成: {len(self.memories)} 个会话，{loaded} 条记忆，耗时 {elapsed:.2f} 秒")
     
-    async def save_memories(self):
-        """保存记忆到文件 (原子化写入，防止损坏)"""
+    @staticmethod
+    def _to_records(session_id: str, memories: List[Dict]) -> Tuple[List[MemoryRecord], int]:
+        """存储格式 -> 内存记录，同时返回旧数据中缺少数值时间戳 (epoch) 而被补齐的条数"""
+        migrated = sum(1 for memory in memories if "epoch" not in memory)
+        return [MemoryRecord.from_dict(session_id, memory) for memory in memories], migrated
+    
+    def _ensure_session(self, session_id: str):
+        """确保会话数据常驻内存 (分片存储下首次访问时加载)，并更新其 LRU 位置"""
+        if self._lazy_source is None:
+            return
+        if session_id not in self.memories and self._lazy_source.has_session(session_id) \
+                and not self._has_unsaved_changes(session_id):
+            # 分片中的旧数据在下次写回该会话时才会带上 epoch，这里每次加载都补齐
+            memories, _ = self._to_records(session_id, self._lazy_source.load_session(session_id))
+            if memories:
+                self.memories[session_id] = memories
+                self.perf.incr("session_loads")
+        self._resident[session_id] = None
+        self._resident.move_to_end(session_id)
+        self._evict_cold_sessions(keep=session_id)
+    
+    def _evict_cold_sessions(self, keep: Optional[str] = None):
+        """常驻会话超过 max_resident_sessions 时，按 LRU 卸载已全部落盘的会话"""
+        limit = self.config.get("max_resident_sessions", 200)
+        if self._lazy_source is None or limit <= 0 or len(self._resident) <= limit:
+            return
+        for session_id in list(self._resident):
+            if len(self._resident) <= limit:
+                break
+            if session_id == keep or self._has_unsaved_changes(session_id):
+                continue
+            del self._resident[session_id]
+            # 派生结构随会话一起卸载；版本号保留，重新加载后内容不变
+            self.memories.pop(session_id, None)
+            self._drop_session_state(session_id)
+            self.perf.incr("session_unloads")
+    
+    def _load_all_sessions(self):
+        """将惰性来源中尚未常驻的会话全部读入内存 (整体保存前需要完整数据)"""
+        for session_id in self._lazy_source.session_ids():
+            if session_id not in self.memories and not self._has_unsaved_changes(session_id):
+                memories, _ = self._to_records(session_id, self._lazy_source.load_session(session_id))
+                if memories:
+                    self.memories[session_id] = memories
+                    self._resident[session_id] = None
+    
+    def session_ids(self, include_archive: bool = False) -> List[str]:
+        """全部会话 ID (含分片存储中尚未加载的会话)，默认不含归档区"""
+        session_ids = list(self.memories)
+        if self._lazy_source is not None:
+            resident = set(session_ids)
+            session_ids.extend(sid for sid in self._lazy_source.session_ids() if sid not in resident)
+        if include_archive:
+            return session_ids
+        return [sid for sid in session_ids if not is_archive(sid)]
+    
+    def iter_session_dicts(self) -> Iterator[Tuple[str, List[Dict]]]:
+        """逐个会话产出存储格式的记忆，不改变常驻状态 (未常驻的会话直接从惰性来源读取)
+        
+        调用方可能在两次产出之间让出事件循环：其间切换存储的整体保存会先读入全部会话并清空 _lazy_source，
+        此后仍不在内存中的会话已被清空，跳过即可。
+        """
+        for session_id in self.session_ids(include_archive=True):
+            memories = self.memories.get(session_id)
+            if memories is not None:
+                yield session_id, [memory.to_dict() for memory in memories]
+            elif self._lazy_source is not None and not self._has_unsaved_changes(session_id):
+                data = self._lazy_source.load_session(session_id)
+                if data:
+                    yield session_id, data
+    
+    async def dump(self, path: str) -> Tuple[int, int]:
+        """将全部记忆导出为带缩进的 JSON 文件 (供调试阅读，与存储编码格式无关)，返回 (会话数, 记忆条数)"""
+        data = dict(self.iter_session_dicts())
+        
+        def write():
+            with open(path, "wb") as f:
+                f.write(codec.encode(data, codec.PRETTY))
+        
+        await asyncio.to_thread(write)
+        return len(data), sum(len(memories) for memories in data.values())
+    
+    def iter_export_records(self) -> Iterator[Dict]:
+        """逐条产出导出记录 (存储格式的记忆加上 session_id 字段)，同一会话的记忆相邻"""
+        for session_id, memories in self.iter_session_dicts():
+            for memory in memories:
+                yield {"session_id": session_id, **memory}
+    
+    async def export_ndjson(self, path: str) -> Tuple[int, int]:
+        """将全部记忆 (含归档区) 导出为 NDJSON 文件，每行一条记忆，返回 (会话数, 记忆条数)
+        
+        记录逐条生成，攒够 TRANSFER_CHUNK 字节就在后台线程写出，内存占用与数据总量无关；
+        先写临时文件，完成后再替换目标文件。
+        """
+        sessions = count = 0
+        last_session = None
+        buffer: List[str] = []
+        size = 0
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in self.iter_export_records():
+                    if record["session_id"] != last_session:
+                        last_session = record["session_id"]
+                        sessions += 1
+                    line = json.dumps(record, ensure_ascii=False)
+                    buffer.append(line)
+                    size += len(line)
+                    count += 1
+                    if size >= TRANSFER_CHUNK:
+                        await asyncio.to_thread(f.write, "\n".join(buffer) + "\n")
+                        buffer, size = [], 0
+                if buffer:
+                    await asyncio.to_thread(f.write, "\n".join(buffer) + "\n")
+            os.replace(tmp_path, path)
+        except BaseException:
+            # 含任务被取消的情况，不留下写了一半的临时文件
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            raise
+        return sessions, count
+    
+    @staticmethod
+    def _parse_import_line(line: str) -> Optional[Tuple[str, Dict]]:
+        """解析一行导入记录，返回 (会话 ID, 存储格式的记忆)；格式不合法时返回 None"""
         try:
-            temp_file = self.data_file + ".tmp"
-            with open(temp_file, "w", encoding='utf-8') as f:
-                json.dump(self.memories, f, ensure_ascii=False, indent=2)
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        session_id = record.pop("session_id", None)
+        content = record.get("content")
+        if not isinstance(session_id, str) or not session_id or not isinstance(content, str) or not content.strip():
+            return None
+        try:
+            record["importance"] = min(max(int(record.get("importance", 1)), 1), 5)
+            if record.get("epoch") is not None:
+                record["epoch"] = int(record["epoch"])
+            elif not record.get("timestamp"):
+                # 手工编写的种子数据可以只给内容，时间记为导入时刻
+                record["epoch"] = int(time.time())
+        except (TypeError, ValueError):
+            return None
+        record["content"] = content.strip()
+        return session_id, record
+    
+    async def import_ndjson(self, path: str) -> Dict[str, int]:
+        """从 NDJSON 文件导入记忆 (格式同 export_ndjson)，全部导入后只保存一次
+        
+        文件分块在后台线程读取，连续的同一会话记录攒成一批交给 ingest_memories，
+        因此解析过程的内存占用与文件大小无关。返回各项统计 (会话数、新增、合并、淘汰、归档、无效行)。
+        """
+        stats = {"sessions": 0, "added": 0, "merged": 0, "evicted": 0, "archived": 0, "invalid": 0}
+        seen = set()
+        batch_session, batch = None, []
+        
+        def ingest():
+            for key, value in self.ingest_memories(batch_session, batch).items():
+                stats[key] += value
+        
+        start = time.perf_counter()
+        with open(path, "r", encoding="utf-8-sig") as f:
+            while True:
+                lines = await asyncio.to_thread(f.readlines, TRANSFER_CHUNK)
+                if not lines:
+                    break
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    parsed = self._parse_import_line(line)
+                    if parsed is None:
+                        stats["invalid"] += 1
+                        continue
+                    session_id, memory = parsed
+                    if session_id != batch_session or len(batch) >= IMPORT_BATCH:
+                        if batch:
+                            ingest()
+                        batch_session, batch = session_id, []
+                        seen.add(session_id)
+                    batch.append(memory)
+            if batch:
+                ingest()
+        stats["sessions"] = len(seen)
+        self.perf.record("import", time.perf_counter() - start)
+        if stats["added"] or stats["merged"] or stats["evicted"]:
+            self._pending_changes += 1
+            await self.flush()
+        return stats
+    
+    def ingest_memories(self, session_id: str, memories: Iterable[Dict]) -> Dict[str, int]:
+        """批量写入一个会话的记忆 (存储格式)，去重与淘汰在一遍内完成；调用方负责之后保存一次
+        
+        与已有记忆或本批其他记忆重复时合并，保留较高的重要性与较新的时间，内容与时间都未变化时不产生变更；
+        写入后超过上限时按淘汰策略一次选出全部需要移除的记忆 (已有的或新导入的都可能被选中)，
+        热区被淘汰的记忆整批移入归档区。返回 {"added", "merged", "evicted" (真正删除), "archived"} 条数。
+        """
+        stats = {"added": 0, "merged": 0, "evicted": 0, "archived": 0}
+        self._ensure_session(session_id)
+        deduper = self._get_deduper(session_id)
+        batch_deduper = DedupIndex(threshold=deduper.threshold)
+        positions: Optional[Dict[int, int]] = None
+        fresh: List[MemoryRecord] = []
+        for data in memories:
+            record = MemoryRecord.from_dict(session_id, data)
+            existing = self._find_duplicate(session_id, record.content)
+            if existing is not None:
+                stats["merged"] += 1
+                newer = record if record.epoch > existing["epoch"] else existing
+                importance = max(existing["importance"], record.importance)
+                if newer is existing and importance == existing["importance"]:
+                    continue
+                if positions is None:
+                    positions = {id(m): i for i, m in enumerate(self.memories[session_id])}
+                self._apply({
+                    "op": "touch", "sid": session_id, "i": positions[id(existing)],
+                    "timestamp": newer["timestamp"], "epoch": newer["epoch"], "importance": importance
+                })
+                self._track_rekey(session_id, existing)
+                continue
+            duplicate = batch_deduper.find(record.content)
+            if duplicate is not None:
+                stats["merged"] += 1
+                if record.epoch > duplicate["epoch"]:
+                    duplicate["timestamp"] = record["timestamp"]
+                    duplicate["epoch"] = record.epoch
+                duplicate["importance"] = max(duplicate["importance"], record.importance)
+                continue
+            batch_deduper.add(record)
+            fresh.append(record)
+        
+        current = self.memories.get(session_id, [])
+        if is_archive(session_id):
+            limit = self.config.get("archive_max_memories", 1000)
+        else:
+            limit = self.config.get("max_memories", 10)
+        overflow = len(current) + len(fresh) - limit
+        victims: List[MemoryRecord] = []
+        if overflow > 0:
+            # 保留淘汰键最大的 limit 条；同键时先淘汰已有的、较早的记忆
+            victims = heapq.nsmallest(overflow, itertools.chain(current, fresh), key=self._get_evictor(session_id).key)
+            victim_ids = {id(m) for m in victims}
+            # 从后往前删除，前面记忆的序号不受影响
+            for position in reversed([i for i, m in enumerate(current) if id(m) in victim_ids]):
+                removed = self._apply({"op": "remove", "sid": session_id, "i": position})
+                self._track_remove(session_id, removed)
+            fresh = [m for m in fresh if id(m) not in victim_ids]
+        
+        for record in fresh:
+            self._apply({"op": "add", "sid": session_id, "memory": record})
+            self._track_add(session_id, record)
+        stats["added"] = len(fresh)
+        
+        if victims and not is_archive(session_id) and self._archive_enabled():
+            # 归档区满时按淘汰策略真正删除，这些计入 evicted
+            stats["archived"] = len(victims)
+            stats["evicted"] = self.ingest_memories(archive_id(session_id), [m.to_dict() for m in victims])["evicted"]
+            self.perf.incr("archived", len(victims))
+        else:
+            stats["evicted"] = len(victims)
+        return stats
+    
+    def _get_index(self, session_id: str) -> SessionIndex:
+        """获取会话的倒排索引，不存在时基于当前记忆构建"""
+        index = self._indexes.get(session_id)
+        if index is None:
+            index = SessionIndex(self.memories.get(session_id, []))
+            self._indexes[session_id] = index
+        return index
+    
+    def _get_evictor(self, session_id: str) -> EvictionHeap:
+        """获取会话的淘汰堆，淘汰策略配置变化时重建"""
+        policy = self.config.get("eviction_policy", "importance")
+        if policy not in EVICTION_POLICIES:
+            policy = "importance"
+        decay_days = self.config.get("eviction_decay_days", 7)
+        evictor = self._evictors.get(session_id)
+        if evictor is None or evictor.policy != policy or evictor.decay_days != decay_days:
+            evictor = EvictionHeap(self.memories.get(session_id, []), policy, decay_days)
+            self._evictors[session_id] = evictor
+        return evictor
+    
+    def _find_duplicate(self, session_id: str, content: str) -> Optional[MemoryRecord]:
+        """查找与 content 重复的已有记忆
+        
+        长于 10 个字符的内容被已有记忆原样包含时视为重复 (经倒排索引取候选后做子串校验)；
+        其余情况交给去重索引，精确匹配或正文近似重复 (MinHash/LSH)。
+        """
+        if len(content) > 10:
+            existing = self._get_index(session_id).containing(content)
+            if existing is not None:
+                return existing
+        return self._get_deduper(session_id).find(content)
+    
+    def _get_deduper(self, session_id: str) -> DedupIndex:
+        """获取会话的去重索引 (签名与阈值无关，阈值变化时直接沿用)"""
+        threshold = self.config.get("dedup_similarity", 0.8)
+        deduper = self._dedupers.get(session_id)
+        if deduper is None:
+            deduper = DedupIndex(self.memories.get(session_id, []), threshold)
+            self._dedupers[session_id] = deduper
+        deduper.threshold = threshold
+        return deduper
+    
+    def _track_add(self, session_id: str, memory: Dict):
+        """同步已构建的索引、淘汰堆与去重索引：新增记忆"""
+        if session_id in self._indexes:
+            self._indexes[session_id].add(memory)
+        if session_id in self._evictors:
+            self._evictors[session_id].push(memory)
+        if session_id in self._dedupers:
+            self._dedupers[session_id].add(memory)
+    
+    def _track_remove(self, session_id: str, memory: Dict):
+        """同步已构建的索引、淘汰堆与去重索引：移除记忆"""
+        if session_id in self._indexes:
+            self._indexes[session_id].remove(memory)
+        if session_id in self._evictors:
+            self._evictors[session_id].discard(memory)
+        if session_id in self._dedupers:
+            self._dedupers[session_id].remove(memory)
+    
+    def _track_edit(self, session_id: str, memory: Dict):
+        """记忆内容变更后刷新内容相关的索引"""
+        if session_id in self._indexes:
+            self._indexes[session_id].update(memory)
+        if session_id in self._dedupers:
+            self._dedupers[session_id].update(memory)
+    
+    def _drop_session_state(self, session_id: str):
+        """丢弃会话的所有派生结构"""
+        self._indexes.pop(session_id, None)
+        self._evictors.pop(session_id, None)
+        self._dedupers.pop(session_id, None)
+        self._scorers.pop(session_id, None)
+        self._sorted_views.pop(session_id, None)
+    
+    def _track_rekey(self, session_id: str, memory: Dict):
+        """记忆的重要性或使用情况变化后更新淘汰键"""
+        if session_id in self._evictors:
+            self._evictors[session_id].push(memory)
+    
+    def _position(self, session_id: str, memory: Dict) -> Optional[int]:
+        """按对象身份查找记忆在会话列表中的序号"""
+        for i, m in enumerate(self.memories.get(session_id, [])):
+            if m is memory:
+                return i
+        return None
+    
+    def _evict_one(self, session_id: str) -> Optional[MemoryRecord]:
+        """按淘汰策略移除一条记忆，其余记忆保持原有顺序；启用归档时热区记忆移入归档区而非删除"""
+        victim = self._get_evictor(session_id).pop()
+        position = self._position(session_id, victim) if victim is not None else None
+        if position is None:
+            # 淘汰堆与会话不同步 (理论上不会发生)，丢弃后下次重建
+            self._evictors.pop(session_id, None)
+            return None
+        self._apply({"op": "remove", "sid": session_id, "i": position})
+        self._track_remove(session_id, victim)
+        if not is_archive(session_id) and self._archive_enabled():
+            self._archive(session_id, victim)
+        return victim
+    
+    def _archive_enabled(self) -> bool:
+        return self.config.get("archive_max_memories", 1000) > 0
+    
+    def _archive(self, session_id: str, memory: MemoryRecord):
+        """将已移出热区的记忆写入归档区，归档区满时按淘汰策略真正删除"""
+        archive_sid = archive_id(session_id)
+        self._ensure_session(archive_sid)
+        archive = self.memories.get(archive_sid, [])
+        while len(archive) >= self.config.get("archive_max_memories", 1000):
+            if self._evict_one(archive_sid) is None:
+                break
+            archive = self.memories.get(archive_sid, [])
+        record = MemoryRecord.from_dict(archive_sid, memory.to_dict())
+        self._apply({"op": "add", "sid": archive_sid, "memory": record})
+        self._track_add(archive_sid, record)
+        self.perf.incr("archived")
+    
+    def _promote(self, session_id: str, memory: MemoryRecord, hit_time: float) -> Optional[MemoryRecord]:
+        """将被召回的归档记忆移回热区 (热区满时按淘汰策略挤出一条到归档区)"""
+        archive_sid = memory.session_id
+        position = self._position(archive_sid, memory)
+        if position is None:
+            return None
+        self._apply({"op": "remove", "sid": archive_sid, "i": position})
+        self._track_remove(archive_sid, memory)
+        
+        self._ensure_session(session_id)
+        while len(self.memories.get(session_id, [])) >= self.config.get("max_memories", 10):
+            if self._evict_one(session_id) is None:
+                break
+        data = memory.to_dict()
+        data["hits"] = data.get("hits", 0) + 1
+        data["last_hit"] = hit_time
+        record = MemoryRecord.from_dict(session_id, data)
+        self._apply({"op": "add", "sid": session_id, "memory": record})
+        self._track_add(session_id, record)
+        self.perf.incr("promoted")
+        return record
+    
+    def _idle_archive_days(self, session_id: str) -> int:
+        """会话适用的闲置归档天数，0 表示不归档 (归档区本身与未启用归档时)"""
+        if is_archive(session_id) or not self._archive_enabled():
+            return 0
+        return self.config.get("archive_idle_days", 0)
+    
+    def archive_idle_memories(self, session_id: str, now: Optional[float] = None) -> int:
+        """将超过 archive_idle_days 天未被写入或召回的热区记忆移入归档区，返回移动条数"""
+        idle_days = self._idle_archive_days(session_id)
+        if idle_days <= 0:
+            return 0
+        cutoff = (time.time() if now is None else now) - idle_days * 86400
+        idle = [m for m in self.memories.get(session_id, []) if self._last_used(m) < cutoff]
+        for memory in idle:
+            position = self._position(session_id, memory)
+            self._apply({"op": "remove", "sid": session_id, "i": position})
+            self._track_remove(session_id, memory)
+            self._archive(session_id, memory)
+        return len(idle)
+    
+    @staticmethod
+    def _last_used(memory) -> float:
+        """最近一次写入或被召回的时间"""
+        return max(memory.get("epoch", 0), memory.get("last_hit", 0))
+    
+    def _maintenance_due(self, session_id: str, memory, now: float) -> bool:
+        """记忆是否到期需要后台维护处理 (过期、衰减或闲置归档)"""
+        idle = now - self._last_used(memory)
+        ttl_days = self.config.get("memory_ttl_days", 0)
+        if ttl_days > 0 and idle >= ttl_days * 86400:
+            return True
+        decay_days = self.config.get("importance_decay_days", 0)
+        if decay_days > 0 and memory.get("importance", 1) > 1 and \
+                now - max(self._last_used(memory), memory.get("decayed_at", 0)) >= decay_days * 86400:
+            return True
+        idle_days = self._idle_archive_days(session_id)
+        return idle_days > 0 and idle >= idle_days * 86400
+    
+    def maintain_session(self, session_id: str, now: Optional[float] = None) -> Dict[str, int]:
+        """后台维护单个会话：删除超过 memory_ttl_days 的记忆，按 importance_decay_days 衰减重要性，
+        将闲置记忆移入归档区，并移除已为空的会话。返回各项处理条数。
+        
+        分片存储中未常驻的会话先只读取数据检查，确有需要处理的记忆时才加载常驻。
+        """
+        now = time.time() if now is None else now
+        stats = {"expired": 0, "decayed": 0, "archived": 0, "dropped": 0}
+        memories = self.memories.get(session_id)
+        if memories is None:
+            if self._lazy_source is None or self._has_unsaved_changes(session_id):
+                return stats
+            if not any(self._maintenance_due(session_id, m, now) for m in self._lazy_source.load_session(session_id)):
+                return stats
+            self._ensure_session(session_id)
+            memories = self.memories.get(session_id)
+            if memories is None:
+                return stats
+        
+        ttl_days = self.config.get("memory_ttl_days", 0)
+        if ttl_days > 0:
+            cutoff = now - ttl_days * 86400
+            for memory in [m for m in memories if self._last_used(m) < cutoff]:
+                self._apply({"op": "remove", "sid": session_id, "i": self._position(session_id, memory)})
+                self._track_remove(session_id, memory)
+                stats["expired"] += 1
+        
+        decay_days = self.config.get("importance_decay_days", 0)
+        if decay_days > 0:
+            cutoff = now - decay_days * 86400
+            for i, memory in enumerate(memories):
+                if memory.importance > 1 and max(self._last_used(memory), memory.get("decayed_at", 0)) < cutoff:
+                    # 每次只降一级并记录衰减时间，再过一个周期仍未使用才继续降级
+                    self._apply({"op": "decay", "sid": session_id, "i": i,
+                                 "importance": memory.importance - 1, "decayed_at": int(now)})
+                    self._track_rekey(session_id, memory)
+                    stats["decayed"] += 1
+        
+        stats["archived"] = self.archive_idle_memories(session_id, now)
+        if session_id in self.memories and not self.memories[session_id]:
+            self._apply({"op": "clear", "sid": session_id})
+            self._drop_session_state(session_id)
+            self._resident.pop(session_id, None)
+            stats["dropped"] = 1
+        return stats
+    
+    async def maintain_storage(self):
+        """让存储后端整理数据 (合并日志、回收数据库空间、清理残留文件)，先将全部变更落盘
+        
+        只有命中记录 (hit) 待落盘时不为此保存：命中信息本就随下一次保存落盘，快照模式下单为它们保存
+        意味着整库复制与重写。分片存储例外，有待落盘变更的会话无法卸载，而分片保存只重写相关会话。
+        """
+        if self._read_only:
+            return
+        if not self._only_hits_pending() or self._lazy_source is not None:
+            await self.flush()
+        async with self._save_lock:
+            storage = self._get_storage()
+            if not self._only_hits_pending() or storage is not self._last_storage:
+                return
+            snapshot = self._snapshot(storage.maintenance_sessions())
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(lambda: storage.maintain(self._materialize(snapshot)))
+            except Exception as e:
+                logger.error(f"整理记忆存储失败: {e}")
+                return
+            self.perf.record("maintain_storage", time.perf_counter() - start)
+            self.perf.set("storage_bytes", await asyncio.to_thread(storage.size_bytes))
+    
+    def _only_hits_pending(self) -> bool:
+        """待落盘的变更是否只有命中记录 (或没有变更)"""
+        return self._pending_changes == 0 and not self._ops
+    
+    def _apply(self, op: Dict) -> Optional[Dict]:
+        """应用一次变更，并记入待落盘的变更记录"""
+        result = apply_op(self.memories, op)
+        self._ops.append(op)
+        self._dirty_sessions.add(op["sid"])
+        if op["op"] != "hit":
+            self._versions[op["sid"]] = self._versions.get(op["sid"], 0) + 1
+        return result
+    
+    def _take_hit_ops(self) -> List[Dict]:
+        """把累积的命中记录折叠为 hit 变更 (每条记忆一条，按当前序号)，排在已有变更之后"""
+        ops = []
+        for session_id, hit_memories in self._pending_hits.items():
+            positions = {id(m): i for i, m in enumerate(self.memories.get(session_id, []))}
+            for key, memory in hit_memories.items():
+                position = positions.get(key)
+                if position is None:
+                    # 命中后已被删除或移入归档区
+                    continue
+                ops.append({"op": "hit", "sid": session_id, "i": position,
+                            "hits": memory.get("hits", 0), "last_hit": memory.get("last_hit")})
+        self._pending_hits = {}
+        return ops
+    
+    def get_session_version(self, session_id: str) -> int:
+        """会话记忆的版本号，任何影响内容的变更都会使其递增"""
+        return self._versions.get(session_id, 0)
+    
+    def _snapshot(self, session_ids: Optional[Iterable[str]]) -> Dict[str, List[MemoryRecord]]:
+        """截取需要持久化的会话 (None 表示全部)：事件循环中只浅复制记忆列表，由 _materialize 在后台线程转换
+        
+        转换期间发生的原地修改 (编辑、重要性、命中等) 可能被一并写入。这些变更都设定绝对值，
+        之后随变更记录再次写入或回放的结果相同；增删只改变列表本身，不影响已截取的副本。
+        """
+        if session_ids is None:
+            session_ids = self.memories.keys()
+        return {sid: list(self.memories[sid]) for sid in session_ids if sid in self.memories}
+    
+    @staticmethod
+    def _materialize(snapshot: Dict[str, List[MemoryRecord]]) -> Dict[str, List[Dict]]:
+        """将截取的记忆列表转换为存储格式 (在后台线程执行)"""
+        return {sid: [m.to_dict() for m in memories] for sid, memories in snapshot.items()}
+    
+    def _has_unsaved_changes(self, session_id: str) -> bool:
+        """会话是否存在尚未写入存储后端的变更 (含正在写入的)"""
+        return session_id in self._dirty_sessions or session_id in self._saving_sessions
+    
+    async def save_memories(self):
+        """保存记忆 (快照模式原子化重写整库，日志模式仅追加变更记录)
+        
+        在事件循环中截取变更记录与所需会话的记忆列表，转换为存储格式、序列化与写盘放到后台线程执行。
+        保存由锁串行化：排队中的保存会拿到此前累积的全部变更 (后续的保存随之合并为空操作)，
+        且较晚截取的快照一定在较早的之后写入，不会被迟到的旧快照覆盖。
+        """
+        if not self._ready or self._read_only:
+            return
+        async with self._save_lock:
+            storage = self._get_storage()
+            full = storage is not self._last_storage
+            pending, self._ops = self._ops, []
+            pending += self._take_hit_ops()
+            dirty, self._dirty_sessions = self._dirty_sessions, set()
+            if not pending and not full:
+                return
+            # 先登记为正在写入，下面读入未常驻会话时才会跳过刚清空的会话，不把它从旧分片中读回来
+            self._saving_sessions = dirty
+            if full and self._lazy_source is not None:
+                # 整体写入需要全部会话，先把未常驻的会话读进来
+                self._load_all_sessions()
             
-            # 写入成功后重命名覆盖，确保原子性
-            if os.path.exists(self.data_file):
-                os.replace(temp_file, self.data_file)
+            # 新增记录引用的是活动对象，转换为存储格式的副本，避免后台线程读到之后的修改
+            ops = [dict(op, memory=op["memory"].to_dict()) if op["op"] == "add" else op for op in pending]
+            snapshot = self._snapshot(None if full else storage.snapshot_sessions(ops))
+            start = time.perf_counter()
+            try:
+                if full:
+                    await asyncio.to_thread(lambda: storage.save_all(self._materialize(snapshot)))
+                    self._last_storage = storage
+                    self._lazy_source = storage if storage.lazy else None
+                else:
+                    await asyncio.to_thread(lambda: storage.save(self._materialize(snapshot), ops))
+            except Exception as e:
+                logger.error(f"保存记忆数据失败: {e}")
+                self.perf.incr("save_failures")
+                # 放回未写入的原始变更 (而非转换后的副本)，下次保存时重试
+                self._ops = pending + self._ops
+                self._dirty_sessions |= dirty
             else:
-                os.rename(temp_file, self.data_file)
-                
-        except Exception as e:
-            logger.error(f"保存记忆数据失败: {e}")
-            if os.path.exists(self.data_file + ".tmp"):
-                try: os.remove(self.data_file + ".tmp")
-                except: pass
+                self.perf.record("save_full" if full else "save", time.perf_counter() - start)
+                self.perf.incr("saves")
+                self.perf.incr("saved_ops", len(ops))
+                self.perf.set("last_save_ops", len(ops))
+                self.perf.set("storage_bytes", await asyncio.to_thread(storage.size_bytes))
+            finally:
+                self._saving_sessions = set()
+            # 刚落盘的冷会话现在可以卸载了
+            self._evict_cold_sessions()
+    
+    async def schedule_save(self):
+        """记录一次变更并按保存策略落盘
+        
+        未启用写回模式时立即保存；启用后变更先合并，在 save_interval_seconds 秒后
+        或累计 save_max_pending 次变更时统一保存一次。
+        """
+        self._pending_changes += 1
+        if not self.config.get("write_behind_enabled", False) or \
+                self._pending_changes >= self.config.get("save_max_pending", 20):
+            await self.flush()
+            return
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+    
+    async def _delayed_flush(self):
+        """等待保存间隔后落盘"""
+        try:
+            await asyncio.sleep(self.config.get("save_interval_seconds", 5))
+        except asyncio.CancelledError:
+            return
+        # 开始保存后不再允许被取消，避免写盘线程与后续保存并发
+        if self._flush_task is asyncio.current_task():
+            self._flush_task = None
+        await self.flush()
+    
+    async def flush(self):
+        """立即保存所有未落盘的变更"""
+        task = self._flush_task
+        self._flush_task = None
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+        
+        if self._pending_changes == 0 and not self._ops and not self._pending_hits:
+            return
+        self._pending_changes = 0
+        await self.save_memories()
+    
+    def close(self):
+        """关闭存储后端 (如数据库连接)"""
+        for storage in self._storages.values():
+            storage.close()
     
     def add_memory(self, session_id: str, content: str, importance: int = 1) -> bool:
         """添加记忆 (包含简单去重逻辑)"""
         if not self.config.get("enable_memory_management", True):
             return False
         
+        self._ensure_session(session_id)
         if session_id not in self.memories:
             self.memories[session_id] = []
         
         content = content.strip()
+        now = datetime.datetime.now()
+        timestamp = now.strftime(TIMESTAMP_FORMAT)
         
-        # 极简去重：如果内容完全一致或包含关系，则更新而非新增
-        for existing in self.memories[session_id]:
-            if content == existing['content'] or (len(content) > 10 and content in existing['content']):
-                existing['timestamp'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                existing['importance'] = max(existing['importance'], min(max(importance, 1), 5))
-                return True
+        # 去重：内容完全一致、被已有记忆包含或正文高度相似 (忽略身份标签) 时，刷新已有记忆而非新增
+        existing = self._find_duplicate(session_id, content)
+        if existing is not None:
+            self._apply({
+                "op": "touch", "sid": session_id, "i": self._position(session_id, existing),
+                "timestamp": timestamp, "epoch": int(now.timestamp()),
+                "importance": max(existing['importance'], min(max(importance, 1), 5))
+            })
+            self._track_rekey(session_id, existing)
+            return True
         
         max_memories = self.config.get("max_memories", 10)
         
-        # 如果记忆数量超限，删除最不重要的
-        if len(self.memories[session_id]) >= max_memories:
-            self.memories[session_id].sort(key=lambda x: x["importance"])
-            self.memories[session_id].pop(0)
+        # 如果记忆数量超限，按淘汰策略删除 (默认删除最不重要且最旧的)
+        while len(self.memories[session_id]) >= max_memories:
+            if self._evict_one(session_id) is None:
+                break
         
-        memory = {
-            "content": content,
-            "importance": min(max(importance, 1), 5),
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "memory_id": f"{session_id}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
-        }
+        memory = MemoryRecord(session_id, content, min(max(importance, 1), 5), int(now.timestamp()))
         
-        self.memories[session_id].append(memory)
+        self._apply({"op": "add", "sid": session_id, "memory": memory})
+        self._track_add(session_id, memory)
         return True
     
-    def get_memories(self, session_id: str) -> List[Dict]:
+    def get_memories(self, session_id: str) -> List[MemoryRecord]:
         """获取指定会话的记忆"""
         if not self.config.get("enable_memory_management", True):
             return []
         
+        self._ensure_session(session_id)
         return self.memories.get(session_id, [])
     
-    def get_memories_sorted(self, session_id: str) -> List[Dict]:
-        """获取按重要性排序的记忆"""
+    def get_memories_sorted(self, session_id: str) -> List[MemoryRecord]:
+        """获取按重要性排序的记忆
+        
+        排序结果按会话版本号缓存，记忆变更后才重新排序；返回的列表为共享视图，调用方不应修改。
+        """
         memories = self.get_memories(session_id)
-        return sorted(memories, key=lambda x: x["importance"], reverse=True)
+        if not memories:
+            return memories
+        version = self.get_session_version(session_id)
+        cached = self._sorted_views.get(session_id)
+        if cached is None or cached[0] != version:
+            cached = (version, sorted(memories, key=lambda x: x["importance"], reverse=True))
+            self._sorted_views[session_id] = cached
+        return cached[1]
+    
+    def get_memories_page(self, session_id: str, page: int, page_size: int) -> Tuple[List[MemoryRecord], int, int]:
+        """按重要性排序后的第 page 页 (从 1 开始，超出范围时取最近的有效页)
+        
+        返回 (本页记忆, 实际页码, 总页数)。
+        """
+        memories = self.get_memories_sorted(session_id)
+        pages = max((len(memories) + page_size - 1) // page_size, 1)
+        page = min(max(page, 1), pages)
+        start = (page - 1) * page_size
+        return memories[start:start + page_size], page, pages
+    
+    def listed_positions(self, session_id: str, listed: Iterable[int]) -> List[int]:
+        """将列表指令显示的序号 (按重要性排序，从 0 开始) 转换为记忆在会话中的下标，超出范围时抛出 ValueError"""
+        ordered = self.get_memories_sorted(session_id)
+        positions = {id(memory): i for i, memory in enumerate(self.memories.get(session_id, []))}
+        result = []
+        for index in listed:
+            if index < 0 or index >= len(ordered):
+                raise ValueError(f"无效的记忆序号: {index + 1}")
+            result.append(positions[id(ordered[index])])
+        return result
+    
+    def get_session_size(self, session_id: str) -> int:
+        """会话记忆条数，分片存储中未加载的会话直接读取索引，不触发加载"""
+        if session_id in self.memories:
+            return len(self.memories[session_id])
+        if self._lazy_source is not None and not self._has_unsaved_changes(session_id):
+            return self._lazy_source.session_size(session_id)
+        return 0
+    
+    def page_all(self, page: int, page_size: int) -> Tuple[List[Tuple[str, int, List[MemoryRecord]]], int, int]:
+        """跨会话分页：会话按 ID 排序后依次展开，每页 page_size 条
+        
+        只加载与本页有交集的会话。返回 ([(会话, 本页首条在会话内的序号, 记忆)], 实际页码, 总页数)。
+        """
+        sizes = [(sid, self.get_session_size(sid)) for sid in sorted(self.session_ids())]
+        total = sum(size for _, size in sizes)
+        pages = max((total + page_size - 1) // page_size, 1)
+        page = min(max(page, 1), pages)
+        start, end = (page - 1) * page_size, page * page_size
+        sections = []
+        offset = 0
+        for session_id, size in sizes:
+            if offset >= end:
+                break
+            if offset + size > start:
+                first = max(start - offset, 0)
+                memories = self.get_memories_sorted(session_id)[first:end - offset]
+                if memories:
+                    sections.append((session_id, first, memories))
+            offset += size
+        return sections, page, pages
     
-    def remove_memory(self, session_id: str, index: int) -> Optional[Dict]:
+    def remove_memory(self, session_id: str, index: int) -> Optional[MemoryRecord]:
         """删除指定序号的记忆"""
+        self._ensure_session(session_id)
         if session_id not in self.memories:
             return None
         
@@ -112,17 +953,38 @@ class MemoryManager:
         if index < 0 or index >= len(memories):
             return None
         
-        return memories.pop(index)
+        removed = self._apply({"op": "remove", "sid": session_id, "i": index})
+        self._track_remove(session_id, removed)
+        return removed
+    
+    def edit_memory(self, session_id: str, index: int, content: str) -> bool:
+        """修改指定序号记忆的内容"""
+        self._ensure_session(session_id)
+        if session_id not in self.memories:
+            return False
+        
+        memories = self.memories[session_id]
+        if index < 0 or index >= len(memories):
+            return False
+        
+        self._apply({"op": "edit", "sid": session_id, "i": index, "content": content})
+        self._track_edit(session_id, memories[index])
+        return True
     
     def clear_memories(self, session_id: str) -> bool:
-        """清空指定会话的所有记忆"""
-        if session_id in self.memories:
-            del self.memories[session_id]
-            return True
-        return False
+        """清空指定会话的所有记忆 (含归档区)"""
+        cleared = False
+        for sid in (session_id, archive_id(session_id)):
+            self._ensure_session(sid)
+            if sid in self.memories:
+                self._apply({"op": "clear", "sid": sid})
+                self._drop_session_state(sid)
+                cleared = True
+        return cleared
     
     def update_memory_importance(self, session_id: str, index: int, importance: int) -> bool:
         """更新记忆的重要性"""
+        self._ensure_session(session_id)
         if session_id not in self.memories:
             return False
         
@@ -130,23 +992,262 @@ class MemoryManager:
         if index < 0 or index >= len(memories):
             return False
         
-        memories[index]["importance"] = min(max(importance, 1), 5)
+        self._apply({"op": "importance", "sid": session_id, "i": index, "importance": min(max(importance, 1), 5)})
+        self._track_rekey(session_id, memories[index])
         return True
     
-    def search_memories(self, session_id: str, keyword: str) -> List[Dict]:
-        """搜索记忆"""
+    def apply_batch(self, session_id: str, operations: List[Dict]) -> Dict:
+        """在一个会话上执行一批变更：全部校验通过后才应用，任一项不合法时不做任何修改
+        
+        每项操作为 {"op": "add", "content", "importance"}、{"op": "remove", "index"}、
+        {"op": "importance", "index", "importance"} 或 {"op": "edit", "index", "content"}，
+        序号 (从 0 开始) 均指批处理开始前的记忆列表。先修改、再从后往前删除、最后新增 (新增可能触发淘汰)，
+        因此序号不会因批内的其他操作而错位。调用方在之后保存一次即可。
+        返回 {"updated": [被修改的记忆], "removed": [被删除的记忆], "added": 新增或合并的条数}；
+        校验失败时抛出 ValueError。
+        """
+        if not self.config.get("enable_memory_management", True):
+            raise ValueError("记忆管理功能已禁用")
+        memories = self.get_memories(session_id)
+        
+        updates: List[Tuple[str, int, object]] = []
+        removes = set()
+        adds: List[Tuple[str, int]] = []
+        for number, operation in enumerate(operations, 1):
+            kind = operation.get("op")
+            if kind == "add":
+                content = str(operation.get("content") or "").strip()
+                if not content:
+                    raise ValueError(f"第 {number} 项操作的记忆内容为空")
+                try:
+                    importance = int(operation.get("importance", 1))
+                except (TypeError, ValueError):
+                    raise ValueError(f"第 {number} 项操作的重要性无效: {operation.get('importance')}")
+                adds.append((content, min(max(importance, 1), 5)))
+                continue
+            if kind not in ("remove", "importance", "edit"):
+                raise ValueError(f"第 {number} 项操作未知: {kind}")
+            index = operation.get("index")
+            if not isinstance(index, int) or index < 0 or index >= len(memories):
+                raise ValueError(f"无效的记忆序号: {index + 1 if isinstance(index, int) else index}")
+            if kind == "remove":
+                removes.add(index)
+            elif kind == "edit":
+                content = str(operation.get("content") or "").strip()
+                if not content:
+                    raise ValueError(f"第 {number} 项操作的记忆内容为空")
+                updates.append((kind, index, content))
+            else:
+                importance = operation.get("importance")
+                if not isinstance(importance, int) or importance < 1 or importance > 5:
+                    raise ValueError("重要性必须在1-5之间")
+                updates.append((kind, index, importance))
+        conflicts = removes & {index for _, index, _ in updates}
+        if conflicts:
+            raise ValueError(f"记忆 {min(conflicts) + 1} 同时被修改和删除")
+        
+        updated = []
+        for kind, index, value in updates:
+            memory = memories[index]
+            if kind == "edit":
+                self._apply({"op": "edit", "sid": session_id, "i": index, "content": value})
+                self._track_edit(session_id, memory)
+            else:
+                self._apply({"op": "importance", "sid": session_id, "i": index, "importance": value})
+                self._track_rekey(session_id, memory)
+            updated.append(memory)
+        removed = []
+        for index in sorted(removes, reverse=True):
+            memory = self._apply({"op": "remove", "sid": session_id, "i": index})
+            self._track_remove(session_id, memory)
+            removed.append(memory)
+        removed.reverse()
+        added = sum(1 for content, importance in adds if self.add_memory(session_id, content, importance))
+        return {"updated": updated, "removed": removed, "added": added}
+    
+    def record_hits(self, session_id: str, hit_memories: List[MemoryRecord]):
+        """记录记忆被召回注入，供 LRU / 衰减淘汰策略使用；归档区的记忆同时移回热区
+        
+        命中信息随下一次保存一并落盘，本身不触发保存；保存前同一记忆的多次命中合并为一条变更。
+        """
+        now = round(time.time(), 3)
+        for memory in hit_memories:
+            if memory.session_id != session_id:
+                # 来自归档区的记忆被召回后移回热区
+                self._promote(session_id, memory, now)
+                continue
+            position = self._position(session_id, memory)
+            if position is None:
+                continue
+            apply_op(self.memories, {"op": "hit", "sid": session_id, "i": position,
+                                     "hits": memory.get("hits", 0) + 1, "last_hit": now})
+            self._pending_hits.setdefault(session_id, {})[id(memory)] = memory
+            self._dirty_sessions.add(session_id)
+            self._track_rekey(session_id, memory)
+    
+    def _time_boost(self, memory: MemoryRecord, now: float) -> int:
+        """24 小时内的记忆给予新鲜度加成"""
+        return 10 if now - memory.get('epoch', 0) < 86400 else 0
+    
+    def _use_bm25(self) -> bool:
+        """是否使用 BM25 评分引擎 (需要 numpy)"""
+        if self.config.get("scoring_engine", "bigram") != "bm25":
+            return False
+        if not numpy_available():
+            if not self._warned_no_numpy:
+                logger.warning("scoring_engine 设置为 bm25 但未安装 numpy，使用 bigram 评分")
+                self._warned_no_numpy = True
+            return False
+        return True
+    
+    def _get_scorer(self, session_id: str) -> BM25Scorer:
+        """获取会话的 BM25 打分器，记忆变更后按版本号重建"""
+        version = self.get_session_version(session_id)
+        cached = self._scorers.get(session_id)
+        if cached is None or cached[0] != version:
+            cached = (version, BM25Scorer(self.memories.get(session_id, [])))
+            self._scorers[session_id] = cached
+        return cached[1]
+    
+    def score_memories(self, session_id: str, query: str, limit: int) -> List[Tuple[float, MemoryRecord]]:
+        """对会话记忆进行召回评分，返回得分最高的 limit 条 (得分, 记忆)
+        
+        bigram 引擎：关键词匹配只作用于与查询共享 bigram 的记忆 (经由倒排索引)，
+        候选不足 limit 条时再按重要性与新鲜度补足。
+        bm25 引擎：基于会话稀疏矩阵一次性为全部记忆打分，匹配分缩放到与 bigram 引擎相同的量纲。
+        """
+        if limit <= 0:
+            return []
+        clean_query = "".join(c for c in query.lower() if c.isalnum())
+        now = time.time()
+        scored = self._score_hot(session_id, clean_query, limit, now)
+        if (not scored or scored[0][0] < ARCHIVE_RECALL_THRESHOLD) and self._archive_enabled():
+            archived = self._score_archive(session_id, clean_query, limit, now)
+            if archived:
+                scored = heapq.nlargest(limit, scored + archived, key=lambda x: x[0])
+        return scored
+    
+    def _score_hot(self, session_id: str, clean_query: str, limit: int, now: float) -> List[Tuple[float, MemoryRecord]]:
+        memories = self.get_memories(session_id)
+        if not memories:
+            return []
+        
+        # 单字查询没有 bigram 词项，仍走 bigram 引擎
+        if len(clean_query) >= 2 and self._use_bm25():
+            return self._get_scorer(session_id).top(clean_query, limit, now)
+        
+        scored = []
+        matched_ids = set()
+        for m, match_score in self._get_index(session_id).match(clean_query):
+            matched_ids.add(id(m))
+            scored.append((match_score + m.get('importance', 1) + self._time_boost(m, now), m))
+        
+        if len(scored) < limit:
+            rest = ((m.get('importance', 1) + self._time_boost(m, now), m)
+                    for m in memories if id(m) not in matched_ids)
+            scored.extend(heapq.nlargest(limit - len(scored), rest, key=lambda x: x[0]))
+        
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return scored[:limit]
+    
+    def _score_archive(self, session_id: str, clean_query: str, limit: int, now: float) -> List[Tuple[float, MemoryRecord]]:
+        """归档区只返回与查询有关键词匹配的记忆，不按重要性补足
+        
+        归档区变动频繁且体量大，始终使用增量维护的倒排索引，不构建 BM25 矩阵。
+        """
+        archive_sid = archive_id(session_id)
+        if not self.get_session_size(archive_sid):
+            return []
+        with self.perf.timer("archive"):
+            self._ensure_session(archive_sid)
+            self.perf.incr("archive_lookups")
+            scored = [(match_score + m.importance + self._time_boost(m, now), m)
+                      for m, match_score in self._get_index(archive_sid).match(clean_query)]
+            return heapq.nlargest(limit, scored, key=lambda x: x[0])
+    
+    def search_memories(self, session_id: str, keyword: str) -> List[MemoryRecord]:
+        """搜索记忆，热区结果在前，其后是归档区的结果
+        
+        会话变更均已落盘时优先使用存储后端的全文索引，否则使用内存倒排索引。
+        """
+        results = self._search_session(session_id, keyword)
+        if keyword and self.get_session_size(archive_id(session_id)):
+            results = results + self._search_session(archive_id(session_id), keyword)
+        return results
+    
+    def _search_session(self, session_id: str, keyword: str) -> List[MemoryRecord]:
         memories = self.get_memories(session_id)
         if not keyword:
             return memories
         
-        return [memory for memory in memories if keyword.lower() in memory["content"].lower()]
+        storage = self._get_storage()
+        if storage is self._last_storage and not self._has_unsaved_changes(session_id):
+            positions = storage.search(session_id, keyword)
+            if positions is not None:
+                return [memories[p] for p in positions if p < len(memories)]
+        
+        keyword = keyword.lower()
+        index = self._get_index(session_id)
+        candidates = index.search(keyword)
+        return [memory for memory in memories if id(memory) in candidates and keyword in index.lowered(memory)]
+    
+    def search_all(self, keyword: str, limit: int) -> Tuple[List[Tuple[str, MemoryRecord]], int]:
+        """(管理员) 跨全部会话 (含归档区) 搜索包含关键词的记忆，返回得分最高的 limit 条
+        
+        先用会话签名排除不可能命中的会话，只校验候选会话的记忆；各会话的结果按
+        重要性与新鲜度排序后经堆归并取前 limit 条。返回 ([(会话, 记忆)], 实际校验的会话数)。
+        未常驻的会话直接读取存储中的数据，不会因检索而被加载常驻。
+        """
+        keyword = keyword.lower()
+        query_mask = SessionSignatures.mask([keyword]) if len(keyword) >= 2 else 0
+        now = time.time()
+        session_ids = self.session_ids(include_archive=True)
+        self._signatures.retain(set(session_ids))
+        per_session = []
+        checked = 0
+        with self.perf.timer("search_all"):
+            for session_id in session_ids:
+                memories = self.memories.get(session_id)
+                if memories is None and self._has_unsaved_changes(session_id):
+                    # 已清空但尚未落盘的会话
+                    continue
+                version = self.get_session_version(session_id)
+                signature = self._signatures.get(session_id, version)
+                if signature is None:
+                    if memories is None:
+                        memories = self._lazy_source.load_session(session_id)
+                    signature = SessionSignatures.mask(m["content"].lower() for m in memories)
+                    self._signatures.set(session_id, version, signature)
+                if signature & query_mask != query_mask:
+                    continue
+                if memories is None:
+                    memories = self._lazy_source.load_session(session_id)
+                checked += 1
+                if session_id in self._indexes:
+                    index = self._indexes[session_id]
+                    matched = (m for m in memories if keyword in index.lowered(m))
+                else:
+                    matched = (m for m in memories if keyword in m["content"].lower())
+                top = heapq.nlargest(limit, ((m.get("importance", 1) + self._time_boost(m, now), m.get("epoch", 0), m)
+                                             for m in matched), key=lambda x: x[:2])
+                if top:
+                    per_session.append([(score, epoch, session_id, m) for score, epoch, m in top])
+            merged = heapq.merge(*per_session, key=lambda x: x[:2], reverse=True)
+            results = []
+            for _, _, session_id, memory in itertools.islice(merged, limit):
+                if not isinstance(memory, MemoryRecord):
+                    memory = MemoryRecord.from_dict(session_id, memory)
+                results.append((session_id, memory))
+        return results, checked
     
     def get_memory_stats(self, session_id: str) -> Dict:
         """获取记忆统计信息"""
         memories = self.get_memories(session_id)
+        archived = self.get_session_size(archive_id(session_id))
         if not memories:
             return {
                 "total": 0,
+                "archived": archived,
                 "avg_importance": 0,
                 "importance_distribution": {}
             }
@@ -161,6 +1262,7 @@ class MemoryManager:
         
         return {
             "total": total,
+            "archived": archived,
             "avg_importance": round(avg_importance, 2),
             "importance_distribution": importance_dist
         } 
\ No newline at end of file
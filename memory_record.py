@@ -0,0 +1,173 @@
+import sys
+import time
+import datetime
+import functools
+from typing import Dict, Optional, Tuple
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+MEMORY_ID_FORMAT = "%Y%m%d%H%M%S"
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """文本时间戳 -> 整数秒 (本地时区)，无法解析时为 0"""
+    try:
+        return int(datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp())
+    except Exception:
+        return 0
+
+
+@functools.lru_cache(maxsize=8192)
+def _quarter_hour(bucket: int) -> Tuple[str, int]:
+    local = time.localtime(bucket)
+    return time.strftime("%Y-%m-%d %H:", local), local.tm_min
+
+
+def format_timestamp(epoch: int) -> str:
+    """整数秒 -> 文本时间戳 (本地时区)
+
+    本地时间换算按 15 分钟分段缓存：所有时区偏移与夏令时切换都对齐到 15 分钟，
+    同一分段内只需加上分秒偏移，避免加载/保存时对每条记忆调用 localtime。
+    """
+    offset = epoch % 900
+    prefix, minute = _quarter_hour(epoch - offset)
+    return f"{prefix}{minute + offset // 60:02d}:{offset % 60:02d}"
+
+
+def _pack_memory_id(session_id: str, memory_id: str):
+    """memory_id 为 "{会话}_{数字}" 且能无损还原时只保留整数后缀"""
+    if memory_id.startswith(session_id) and memory_id[len(session_id):len(session_id) + 1] == "_":
+        suffix = memory_id[len(session_id) + 1:]
+        if suffix.isdigit() and suffix[0] != "0":
+            return int(suffix)
+    return memory_id
+
+
+class MemoryRecord:
+    """常驻内存的单条记忆
+
+    使用 __slots__ 存储，会话 ID 经 sys.intern 共享同一字符串对象；时间只保存整数秒 (epoch)，
+    文本时间戳按需格式化；memory_id 形如 "{会话}_{YYYYmmddHHMMSS}" 时只保存数字后缀。
+    仍支持 record["content"] / record.get("hits", 0) 等字典式读写，调用方无需区分。
+    与 JSON 格式的互转只发生在加载 (from_dict) 与保存 (to_dict) 时。
+    """
+
+    __slots__ = ("content", "importance", "epoch", "session_id", "hits", "last_hit", "_mid", "extra")
+
+    FIELDS = frozenset(("content", "importance", "timestamp", "epoch", "memory_id", "hits", "last_hit"))
+
+    def __init__(self, session_id: str, content: str, importance: int, epoch: int,
+                 memory_id: Optional[str] = None, hits: int = 0, last_hit: float = 0.0,
+                 extra: Optional[Dict] = None):
+        self.session_id = sys.intern(session_id)
+        self.content = content
+        self.importance = importance
+        self.epoch = epoch
+        self.hits = hits
+        self.last_hit = last_hit
+        self.extra = extra
+        self.memory_id = memory_id if memory_id is not None else \
+            f"{session_id}_{datetime.datetime.fromtimestamp(epoch).strftime(MEMORY_ID_FORMAT)}"
+
+    @property
+    def timestamp(self) -> str:
+        if self.extra and "timestamp" in self.extra:
+            return self.extra["timestamp"]
+        return format_timestamp(self.epoch)
+
+    @timestamp.setter
+    def timestamp(self, value: str):
+        if self.extra:
+            self.extra.pop("timestamp", None)
+        self.epoch = parse_timestamp(value)
+
+    @property
+    def memory_id(self) -> str:
+        if isinstance(self._mid, int):
+            return f"{self.session_id}_{self._mid}"
+        return self._mid
+
+    @memory_id.setter
+    def memory_id(self, value: str):
+        self._mid = _pack_memory_id(self.session_id, value)
+
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict) -> "MemoryRecord":
+        """从存储格式的字典构建；旧数据缺少 epoch 时由文本时间戳推算
+
+        加载时每条记忆都会经过这里，因此直接填充各槽位，不经过 __init__ 与属性设置器。
+        """
+        timestamp = data.get("timestamp")
+        epoch = data.get("epoch")
+        epoch = parse_timestamp(timestamp or "") if epoch is None else int(epoch)
+        extra = {k: data[k] for k in data.keys() - cls.FIELDS} or None
+        if timestamp is not None and timestamp != format_timestamp(epoch):
+            # 文本时间戳与 epoch 不一致 (格式异常或时区变化)，原样保留以免展示内容改变
+            extra = dict(extra or (), timestamp=timestamp)
+
+        record = cls.__new__(cls)
+        record.session_id = session_id = sys.intern(session_id)
+        record.content = data["content"]
+        record.importance = int(data.get("importance", 1))
+        record.epoch = epoch
+        record.hits = data.get("hits", 0)
+        record.last_hit = data.get("last_hit", 0.0)
+        record.extra = extra
+        memory_id = data.get("memory_id")
+        if memory_id is None:
+            memory_id = f"{session_id}_{datetime.datetime.fromtimestamp(epoch).strftime(MEMORY_ID_FORMAT)}"
+        record._mid = _pack_memory_id(session_id, memory_id)
+        return record
+
+    def to_dict(self) -> Dict:
+        """转换为存储格式的字典 (与旧版 JSON 结构一致)"""
+        data = {
+            "content": self.content,
+            "importance": self.importance,
+            "timestamp": self.timestamp,
+            "epoch": self.epoch,
+            "memory_id": self.memory_id,
+        }
+        if self.hits:
+            data["hits"] = self.hits
+            data["last_hit"] = self.last_hit
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # 字典式访问，兼容按键读写记忆的既有代码
+    def __getitem__(self, key: str):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key in self.FIELDS:
+            setattr(self, key, int(value) if key == "epoch" else value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other) -> bool:
+        # 与字典一致按内容比较 (索引等结构以对象身份 id() 区分记忆，不依赖相等性)
+        if isinstance(other, MemoryRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"MemoryRecord({self.memory_id!r}, {self.content[:20]!r}, importance={self.importance})"
@@ -0,0 +1,73 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List
+
+# 每个阶段保留最近多少次耗时样本
+DEFAULT_WINDOW = 1024
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """已排序样本的 p 分位数 (最近秩)"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class PerfRecorder:
+    """热路径耗时与计数器
+
+    每个阶段只保留最近 window 个耗时样本 (滚动窗口)，记录时仅做一次 deque 追加；
+    分位数在查看时才排序计算，因此对请求路径几乎没有额外开销。
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._totals: Dict[str, int] = {}
+        self.counters: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float):
+        """记录一次阶段耗时 (秒)"""
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._totals[stage] = self._totals.get(stage, 0) + 1
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def incr(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        self.counters[name] = value
+
+    def stage_stats(self) -> Dict[str, Dict]:
+        """各阶段最近窗口内的分位数 (毫秒)"""
+        stats = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[stage] = {
+                "count": self._totals[stage],
+                "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+            }
+        return stats
+
+    def snapshot(self) -> Dict:
+        """导出全部指标，供指令展示或外部采集"""
+        return {"stages": self.stage_stats(), "counters": dict(self.counters)}
+
+    def reset(self):
+        self._samples.clear()
+        self._totals.clear()
+        self.counters.clear()
@@ -0,0 +1,373 @@
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("astrbot")
+
+
+class RerankCache:
+    """LLM 精选结果缓存 (LRU + TTL)
+
+    键包含会话的记忆版本号，会话记忆发生任何变更后旧结果自然失效。
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 600):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (写入时间, 选中的候选序号)
+        self._entries: "OrderedDict[Tuple, Tuple[float, Tuple[int, ...]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(session_id: str, version: int, query: str, candidates: List[Dict]) -> Tuple:
+        normalized = "".join(c for c in query.lower() if c.isalnum())
+        # 同一版本内记忆对象不会变化，以对象身份标识候选集
+        return (session_id, version, normalized, tuple(id(m) for m in candidates))
+
+    def get(self, key: Tuple) -> Optional[Tuple[int, ...]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Tuple, selected: Tuple[int, ...]):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic(), selected)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后，在冷却期内直接跳过调用
+
+    状态: closed (正常) -> open (熔断冷却中) -> half_open (冷却结束，只放行一次试探调用)。
+    试探成功则恢复 closed，失败则立即重新 open；试探调用迟迟没有结果 (如被取消) 时，
+    超过一个冷却期后再放行下一次试探。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_started = 0.0
+        self.trips = 0
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于熔断状态 (含等待试探结果的 half_open)"""
+        return self.state != self.CLOSED
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now < self.open_until:
+                return False
+            self.state = self.HALF_OPEN
+        elif now - self.probe_started < self.cooldown:
+            # half_open 且试探调用仍在进行
+            return False
+        self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self):
+        if self.state == self.HALF_OPEN:
+            self._trip()
+        elif self.state == self.CLOSED:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + self.cooldown
+        self.failures = 0
+        self.trips += 1
+
+
+class _ProviderGuard:
+    """单个精选模型的并发限制与熔断状态"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.breaker = CircuitBreaker()
+
+
+class _RerankJob:
+    """等待合并精选的单个请求"""
+
+    def __init__(self, query: str, candidates: List[Dict], inject_k: int, future: asyncio.Future):
+        self.query = query
+        self.candidates = candidates
+        self.inject_k = inject_k
+        self.future = future
+
+
+class RerankBatcher:
+    """精选请求微批处理
+
+    同一模型在 rerank_batch_window_ms 窗口内到达的精选请求合并为一次调用 (每个请求一段)，
+    再从回复中按任务编号拆出各自的 ID 列表；回复中缺失或无法解析的任务单独重试。
+    窗口内请求数达到 rerank_batch_max_jobs 时立即发送。
+    """
+
+    LINE_PATTERN = re.compile(r"任务\s*(\d+)\s*[:：]\s*(.*)")
+
+    def __init__(self, reranker: "Reranker"):
+        self.reranker = reranker
+        self._pending: Dict[str, List[_RerankJob]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+        # 持有已派发批次的引用，避免任务在完成前被回收
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, provider_id: str, query: str, candidates: List[Dict],
+                     inject_k: int) -> Optional[Tuple[int, ...]]:
+        config = self.reranker.config
+        job = _RerankJob(query, candidates, inject_k, asyncio.get_running_loop().create_future())
+        jobs = self._pending.setdefault(provider_id, [])
+        jobs.append(job)
+
+        if len(jobs) >= config.get("rerank_batch_max_jobs", 8):
+            timer = self._timers.pop(provider_id, None)
+            if timer is not None:
+                timer.cancel()
+            task = asyncio.create_task(self._dispatch(provider_id, self._pending.pop(provider_id)))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+        elif provider_id not in self._timers:
+            self._timers[provider_id] = asyncio.create_task(
+                self._dispatch_later(provider_id, config.get("rerank_batch_window_ms", 0) / 1000))
+        return await job.future
+
+    async def _dispatch_later(self, provider_id: str, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        self._timers.pop(provider_id, None)
+        await self._dispatch(provider_id, self._pending.pop(provider_id, []))
+
+    async def _dispatch(self, provider_id: str, jobs: List[_RerankJob]):
+        if not jobs:
+            return
+        try:
+            if len(jobs) == 1:
+                results = [await self.reranker._call_provider(
+                    provider_id, jobs[0].query, jobs[0].candidates, jobs[0].inject_k)]
+            else:
+                results = await self._run_batch(provider_id, jobs)
+        except Exception as e:
+            logger.error(f"批量精选记忆失败: {e}")
+            results = [None] * len(jobs)
+        for job, result in zip(jobs, results):
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _build_batch_prompt(self, jobs: List[_RerankJob]) -> str:
+        sections = []
+        for n, job in enumerate(jobs):
+            memory_list_str = "\n".join([f"ID:{i} | {m['content']}" for i, m in enumerate(job.candidates)])
+            sections.append(f"""### 任务 {n}
+请挑选 1-{job.inject_k} 条。
+当前用户输入: "{job.query}"
+候选记忆:
+{memory_list_str}""")
+        body = "\n\n".join(sections)
+        example = "\n".join(f"任务{n}: 0,2" if n == 0 else f"任务{n}: None" for n in range(min(len(jobs), 2)))
+        return f"""作为记忆管理助手，下面有 {len(jobs)} 个互相独立的记忆精选任务。请分别为每个任务，从该任务自己的候选记忆中挑选出与其用户输入最相关的记忆。
+
+{body}
+
+请为每个任务输出一行，格式为"任务编号: 记忆ID"，ID 用逗号分隔；某个任务没有相关记忆时输出 None。例如:
+{example}"""
+
+    async def _run_batch(self, provider_id: str, jobs: List[_RerankJob]) -> List[Optional[Tuple[int, ...]]]:
+        reranker = self.reranker
+        reranker.stats["batches"] += 1
+        reranker.stats["batched_jobs"] += len(jobs)
+        text = await reranker._text_chat(provider_id, self._build_batch_prompt(jobs))
+        if text is None:
+            # 模型失败、超时或熔断，整批交给算法兜底
+            return [None] * len(jobs)
+
+        answers: Dict[int, str] = {}
+        for line in text.splitlines():
+            match = self.LINE_PATTERN.search(line)
+            if match:
+                answers.setdefault(int(match.group(1)), match.group(2))
+
+        results: List[Optional[Tuple[int, ...]]] = []
+        retry = []
+        for n, job in enumerate(jobs):
+            if n in answers:
+                results.append(reranker._parse_ids(answers[n], len(job.candidates)))
+            else:
+                results.append(None)
+                retry.append(n)
+        if retry:
+            reranker.stats["batch_parse_fallbacks"] += len(retry)
+            retried = await asyncio.gather(*[
+                reranker._call_provider(provider_id, jobs[n].query, jobs[n].candidates, jobs[n].inject_k)
+                for n in retry])
+            for n, result in zip(retry, retried):
+                results[n] = result
+        return results
+
+
+class Reranker:
+    """使用大模型从候选记忆中精选最相关的几条
+
+    每次调用都有时间预算 (rerank_timeout_ms，含排队等待并发名额的时间)，超时即交给算法兜底；
+    每个模型的在途调用数受 rerank_max_concurrency 限制；连续失败或超时
+    rerank_breaker_threshold 次后熔断 rerank_breaker_cooldown 秒，期间直接走兜底。
+    """
+
+    def __init__(self, context, config: dict):
+        self.context = context
+        self.config = config
+        self.cache = RerankCache(config.get("rerank_cache_size", 256), config.get("rerank_cache_ttl", 600))
+        self._guards: Dict[str, _ProviderGuard] = {}
+        self.batcher = RerankBatcher(self)
+        self.stats = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "short_circuits": 0,
+            "batches": 0,
+            "batched_jobs": 0,
+            "batch_parse_fallbacks": 0,
+        }
+
+    def _get_guard(self, provider_id: str) -> _ProviderGuard:
+        concurrency = self.config.get("rerank_max_concurrency", 4)
+        guard = self._guards.get(provider_id)
+        if guard is None:
+            guard = _ProviderGuard(concurrency)
+            self._guards[provider_id] = guard
+        elif guard.concurrency != concurrency:
+            # 并发上限变更后新调用使用新的信号量，在途调用照常释放旧的
+            guard.concurrency = concurrency
+            guard.semaphore = asyncio.Semaphore(concurrency)
+        guard.breaker.failure_threshold = self.config.get("rerank_breaker_threshold", 3)
+        guard.breaker.cooldown = self.config.get("rerank_breaker_cooldown", 60)
+        return guard
+
+    def get_stats(self) -> Dict:
+        """精选调用计数器，供运维查看"""
+        stats = dict(self.stats)
+        stats["cache_hits"] = self.cache.hits
+        stats["cache_misses"] = self.cache.misses
+        stats["cache_size"] = len(self.cache)
+        stats["open_breakers"] = [pid for pid, g in self._guards.items() if g.breaker.is_open]
+        stats["breaker_trips"] = sum(g.breaker.trips for g in self._guards.values())
+        return stats
+
+    def _record_failure(self, provider_id: str, guard: _ProviderGuard):
+        trips = guard.breaker.trips
+        guard.breaker.record_failure()
+        if guard.breaker.trips != trips:
+            logger.warning(f"记忆精选模型 {provider_id} 连续失败，熔断 {guard.breaker.cooldown} 秒")
+
+    def _build_prompt(self, query: str, candidates: List[Dict], inject_k: int) -> str:
+        memory_list_str = "\n".join([f"ID:{i} | {m['content']}" for i, m in enumerate(candidates)])
+        return f"""作为记忆管理助手，请从以下记忆库中挑选出与当前用户输入最相关的 1-{inject_k} 条记忆。
+当前用户输入: "{query}"
+
+候选记忆:
+{memory_list_str}
+
+请仅输出最相关的记忆 ID，用逗号分隔，如: 0,2。如果没有相关的，请直接输出 None。"""
+
+    @staticmethod
+    def _parse_ids(text: str, count: int) -> Tuple[int, ...]:
+        if not text or "None" in text:
+            return ()
+        return tuple(i for i in (int(x) for x in re.findall(r'\d+', text)) if 0 <= i < count)
+
+    async def _text_chat(self, provider_id: str, prompt: str) -> Optional[str]:
+        """在时间预算、并发限制与熔断保护下调用精选模型，失败、超时或熔断时返回 None"""
+        provider = self.context.get_provider_by_id(provider_id)
+        if not provider:
+            return None
+
+        guard = self._get_guard(provider_id)
+        if not guard.breaker.allow():
+            self.stats["short_circuits"] += 1
+            return None
+
+        async def guarded_call():
+            async with guard.semaphore:
+                return await provider.text_chat(prompt=prompt, contexts=[])
+
+        self.stats["calls"] += 1
+        timeout = self.config.get("rerank_timeout_ms", 5000) / 1000
+        try:
+            resp = await asyncio.wait_for(guarded_call(), timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            self._record_failure(provider_id, guard)
+            logger.warning(f"LLM 精选记忆超时 ({timeout:.1f}s)，改用算法兜底")
+            return None
+        except Exception as e:
+            self.stats["failures"] += 1
+            self._record_failure(provider_id, guard)
+            logger.error(f"LLM 精选记忆失败: {e}")
+            return None
+
+        self.stats["successes"] += 1
+        guard.breaker.record_success()
+        return (resp.completion_text if resp else "") or ""
+
+    async def _call_provider(self, provider_id: str, query: str, candidates: List[Dict],
+                             inject_k: int) -> Optional[Tuple[int, ...]]:
+        """单独发起一次精选，失败时返回 None"""
+        text = await self._text_chat(provider_id, self._build_prompt(query, candidates, inject_k))
+        if text is None:
+            return None
+        return self._parse_ids(text, len(candidates))
+
+    async def rerank(self, provider_id: str, session_id: str, version: int, query: str,
+                     candidates: List[Dict], inject_k: int) -> List[Dict]:
+        """返回精选出的记忆；命中缓存时不再调用模型"""
+        self.cache.max_size = self.config.get("rerank_cache_size", 256)
+        self.cache.ttl = self.config.get("rerank_cache_ttl", 600)
+
+        key = RerankCache.make_key(session_id, version, query, candidates)
+        selected = self.cache.get(key)
+        if selected is None:
+            if self.config.get("rerank_batch_window_ms", 0) > 0:
+                selected = await self.batcher.submit(provider_id, query, candidates, inject_k)
+            else:
+                selected = await self._call_provider(provider_id, query, candidates, inject_k)
+            if selected is None:
+                return []
+            self.cache.put(key, selected)
+        return [candidates[i] for i in selected]
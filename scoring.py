@@ -0,0 +1,100 @@
+import math
+import logging
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，缺失时退回 bigram 评分
+    np = None
+
+from .memory_index import iter_bigrams
+
+logger = logging.getLogger("astrbot")
+
+# 与 bigram 评分保持同一量纲：满分匹配约等于整句包含的 40 分
+MATCH_SCALE = 40
+# bigram 评分中命中一个 bigram 的得分，也是兜底筛选判定"强相关"的分数线 (见 main.py)。
+# BM25 匹配分映射到 [MATCH_FLOOR, MATCH_SCALE]：有任何词项命中的记忆至少得到这一分数，
+# 因此两种引擎下越过兜底分数线的记忆相同，只是排序不同
+MATCH_FLOOR = 15
+FRESH_BOOST = 10
+FRESH_SECONDS = 86400
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+class BM25Scorer:
+    """单个会话的 BM25 打分器
+
+    以字符 bigram 为词项，构建按词项组织的稀疏矩阵 (每个词项一段文档下标与预先算好的
+    BM25 词频权重)。查询时每个词项做一次向量化累加，再整体加上重要性与新鲜度。
+    记忆变更后由调用方按会话版本号重建。
+    """
+
+    def __init__(self, memories: List[Dict], k1: float = 1.2, b: float = 0.75):
+        self.memories = list(memories)
+        self.k1 = k1
+        n = len(self.memories)
+
+        term_docs: Dict[str, List[int]] = {}
+        term_tfs: Dict[str, List[int]] = {}
+        lengths = []
+        for doc, memory in enumerate(self.memories):
+            counts: Dict[str, int] = {}
+            for bigram in iter_bigrams(memory["content"].lower()):
+                counts[bigram] = counts.get(bigram, 0) + 1
+            lengths.append(max(len(memory["content"]) - 1, 1))
+            for term, tf in counts.items():
+                term_docs.setdefault(term, []).append(doc)
+                term_tfs.setdefault(term, []).append(tf)
+
+        doc_len = np.asarray(lengths, dtype=np.float64)
+        avgdl = float(doc_len.mean()) if n else 1.0
+        norm = k1 * (1 - b + b * doc_len / avgdl)
+
+        self.n = n
+        self._postings: Dict[str, Tuple["np.ndarray", "np.ndarray"]] = {}
+        self._idf: Dict[str, float] = {}
+        for term, docs in term_docs.items():
+            idx = np.asarray(docs, dtype=np.int32)
+            tf = np.asarray(term_tfs[term], dtype=np.float64)
+            self._postings[term] = (idx, tf * (k1 + 1) / (tf + norm[idx]))
+            self._idf[term] = self._idf_for(len(docs))
+
+        self.importance = np.asarray([m.get("importance", 1) for m in self.memories], dtype=np.float64)
+        self.epoch = np.asarray([m.get("epoch", 0) for m in self.memories], dtype=np.float64)
+
+    def _idf_for(self, df: int) -> float:
+        return math.log(1 + (self.n - df + 0.5) / (df + 0.5))
+
+    def score(self, clean_query: str, now: float) -> "np.ndarray":
+        """返回每条记忆的总分 (匹配分 + 重要性 + 新鲜度)"""
+        match = np.zeros(self.n, dtype=np.float64)
+        upper = 0.0
+        for term in set(iter_bigrams(clean_query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                upper += self._idf_for(0) * (self.k1 + 1)
+                continue
+            upper += idf * (self.k1 + 1)
+            idx, weights = self._postings[term]
+            # 同一词项内文档下标唯一，可直接花式索引累加
+            match[idx] += idf * weights
+        if upper > 0:
+            match = np.where(match > 0, MATCH_FLOOR + match * ((MATCH_SCALE - MATCH_FLOOR) / upper), 0.0)
+        fresh = (now - self.epoch < FRESH_SECONDS) * FRESH_BOOST
+        return match + self.importance + fresh
+
+    def top(self, clean_query: str, limit: int, now: float) -> List[Tuple[float, Dict]]:
+        """返回得分最高的 limit 条 (得分, 记忆)"""
+        if not self.n or limit <= 0:
+            return []
+        scores = self.score(clean_query, now)
+        if limit < self.n:
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            candidates = np.arange(self.n)
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(round(float(scores[i]), 2), self.memories[i]) for i in order]
@@ -0,0 +1,764 @@
+import datetime
+import hashlib
+import json
+import os
+import logging
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Iterator, Optional, Set, Tuple
+
+from . import codec
+
+logger = logging.getLogger("astrbot")
+
+JOURNAL_SUFFIX = ".journal"
+# 快照中记录已合并日志序号的保留键，加载时会被剥离，不会出现在会话列表中
+JOURNAL_SEQ_KEY = "__journal_seq__"
+
+
+def quarantine(path: str) -> Optional[str]:
+    """将损坏的数据文件改名隔离 (而不是在下次保存时被覆盖)，返回隔离后的路径"""
+    if not os.path.exists(path):
+        return None
+    target = f"{path}.corrupt-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+    try:
+        os.replace(path, target)
+    except OSError as e:
+        logger.error(f"隔离损坏的记忆数据文件 {path} 失败: {e}")
+        return None
+    logger.error(f"记忆数据文件 {path} 已损坏，已隔离为 {target}，请手动检查恢复")
+    return target
+
+
+def apply_op(memories: Dict[str, List[Dict]], op: Dict) -> Optional[Dict]:
+    """将一条变更记录应用到记忆数据上，返回受影响的记忆 (若有)
+
+    MemoryManager 的所有变更与日志回放都经过此函数，保证两者结果一致。
+    """
+    kind = op["op"]
+    session_id = op["sid"]
+    if kind == "add":
+        memories.setdefault(session_id, []).append(op["memory"])
+        return op["memory"]
+    if kind == "clear":
+        memories.pop(session_id, None)
+        return None
+
+    session = memories.get(session_id)
+    if not session:
+        return None
+    index = op["i"]
+    if index < 0 or index >= len(session):
+        return None
+    if kind == "remove":
+        return session.pop(index)
+    memory = session[index]
+    if kind == "edit":
+        memory["content"] = op["content"]
+    elif kind == "importance":
+        memory["importance"] = op["importance"]
+    elif kind == "touch":
+        memory["timestamp"] = op["timestamp"]
+        memory["epoch"] = op["epoch"]
+        memory["importance"] = op["importance"]
+    elif kind == "hit":
+        memory["hits"] = op["hits"]
+        memory["last_hit"] = op["last_hit"]
+    elif kind == "decay":
+        memory["importance"] = op["importance"]
+        memory["decayed_at"] = op["decayed_at"]
+    return memory
+
+
+class StorageBackend:
+    """存储后端基类
+
+    运行时 MemoryManager 始终以内存中的字典为准，后端只负责持久化：
+    load 读出全部记忆；save 持久化自上次保存以来的变更记录；
+    save_all 不依赖变更记录，整体写入 (用于切换后端或数据迁移)。
+    save/save_all 在后台线程中执行，传入的是 snapshot_sessions 所要求会话的独立副本。
+    """
+
+    # 是否按会话惰性加载：为 True 时 load 只读取会话索引，会话数据经 load_session 按需读取
+    lazy = False
+
+    def __init__(self, data_file: str):
+        self.data_file = data_file
+        self.journal_file = data_file + JOURNAL_SUFFIX
+        # 写入快照/分片时使用的编码格式 (见 codec.CODECS)，读取时按文件头自动识别
+        self.codec = "json"
+        # 最近一次读取到的数据编码格式，与 codec 不同时需要整体重写以完成迁移
+        self.loaded_codec: Optional[str] = None
+        # 最近一次加载时是否隔离了损坏的数据文件 (之后需要整体重写)
+        self.quarantined = False
+
+    def needs_rewrite(self) -> bool:
+        """已加载的数据是否仍是旧编码格式，或加载时隔离过损坏的文件"""
+        return self.quarantined or \
+            (self.loaded_codec is not None and self.loaded_codec != codec.resolve_codec(self.codec))
+
+    def _write_file(self, path: str, data):
+        """按当前编码格式原子化写入 (.tmp 写入成功后重命名覆盖)"""
+        temp_file = path + ".tmp"
+        try:
+            with open(temp_file, "wb") as f:
+                f.write(codec.encode(data, self.codec))
+            os.replace(temp_file, path)
+        except Exception:
+            if os.path.exists(temp_file):
+                try: os.remove(temp_file)
+                except: pass
+            raise
+
+    def load(self) -> Dict[str, List[Dict]]:
+        raise NotImplementedError
+
+    def load_sessions(self) -> Iterator[Tuple[str, List[Dict]]]:
+        """逐个会话产出全部记忆，调用方可边读边转换，不必同时持有全部解析结果"""
+        data = self.load()
+        for session_id in list(data):
+            yield session_id, data.pop(session_id)
+
+    def save(self, memories: Dict[str, List[Dict]], ops: List[Dict]):
+        raise NotImplementedError
+
+    def save_all(self, memories: Dict[str, List[Dict]]):
+        raise NotImplementedError
+
+    def snapshot_sessions(self, ops: List[Dict]) -> Optional[Set[str]]:
+        """保存这批变更时需要哪些会话的完整数据，None 表示全部会话"""
+        return None
+
+    def search(self, session_id: str, keyword: str) -> Optional[List[int]]:
+        """在持久化数据中搜索，返回命中记忆的序号；不支持时返回 None"""
+        return None
+
+    def session_ids(self) -> List[str]:
+        """持久化数据中的全部会话 (仅惰性后端需要实现)"""
+        return []
+
+    def has_session(self, session_id: str) -> bool:
+        return False
+
+    def load_session(self, session_id: str) -> List[Dict]:
+        """读取单个会话的记忆 (仅惰性后端需要实现)"""
+        return []
+
+    def session_size(self, session_id: str) -> int:
+        """不加载会话数据时得知其记忆条数 (仅惰性后端需要实现)"""
+        return 0
+
+    def maintenance_sessions(self) -> Optional[Set[str]]:
+        """后台整理时需要哪些会话的完整数据，None 表示全部会话"""
+        return set()
+
+    def maintain(self, memories: Dict[str, List[Dict]]):
+        """后台整理 (合并日志、回收空间、清理残留文件等)，在全部变更落盘后于后台线程执行"""
+        self._remove_stale_temp(self.data_file)
+
+    @staticmethod
+    def _remove_stale_temp(path: str):
+        """清理写入中途崩溃遗留的 .tmp 文件"""
+        if os.path.exists(path + ".tmp"):
+            os.remove(path + ".tmp")
+
+    def size_bytes(self) -> int:
+        """持久化数据当前占用的磁盘字节数"""
+        return sum(os.path.getsize(f) for f in (self.data_file, self.journal_file) if os.path.exists(f))
+
+    def close(self):
+        pass
+
+
+class SnapshotStorage(StorageBackend):
+    """整库快照存储：每次保存原子化重写整个快照文件 (编码格式见 codec 模块)"""
+
+    def _ensure_data_file(self):
+        if not os.path.exists(self.data_file):
+            with open(self.data_file, "w", encoding='utf-8') as f:
+                f.write("{}")
+
+    def _read_snapshot(self) -> Dict:
+        self._ensure_data_file()
+        try:
+            data, self.loaded_codec = codec.read_file(self.data_file)
+            return data
+        except Exception as e:
+            logger.error(f"加载记忆数据失败: {e}")
+            self.quarantined = quarantine(self.data_file) is not None
+            return {}
+
+    def _iter_snapshot(self) -> Iterator[Tuple[str, List[Dict]]]:
+        """增量读取快照中的会话；文件损坏时隔离该文件，此前已读出的会话仍然保留"""
+        self._ensure_data_file()
+        loaded = 0
+        try:
+            self.loaded_codec, items = codec.iter_file_items(self.data_file)
+            for key, value in items:
+                if key == JOURNAL_SEQ_KEY:
+                    self.seq = value
+                    continue
+                loaded += 1
+                yield key, value
+        except Exception as e:
+            logger.error(f"加载记忆数据失败 (已读出 {loaded} 个会话): {e}")
+            self.quarantined = quarantine(self.data_file) is not None
+
+    def _write_snapshot(self, data: Dict):
+        self._write_file(self.data_file, data)
+
+    def load(self) -> Dict[str, List[Dict]]:
+        """加载全部记忆"""
+        data = self._read_snapshot()
+        data.pop(JOURNAL_SEQ_KEY, None)
+        return data
+
+    def load_sessions(self) -> Iterator[Tuple[str, List[Dict]]]:
+        return self._iter_snapshot()
+
+    def save(self, memories: Dict[str, List[Dict]], ops: List[Dict]):
+        self.save_all(memories)
+
+    def save_all(self, memories: Dict[str, List[Dict]]):
+        """保存全部记忆，快照已包含所有变更，遗留的日志文件随之作废"""
+        self._write_snapshot(memories)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+
+class JournalStorage(SnapshotStorage):
+    """快照 + 追加日志存储
+
+    每次变更以一行紧凑 JSON 追加到日志文件，加载时先读快照再回放日志；
+    日志超过 compact_threshold 字节时合并为新快照并清空日志。
+    每条日志带递增序号，快照记录已合并的最大序号，因此即使在写快照与清空日志之间崩溃，
+    也不会重复回放。
+    """
+
+    def __init__(self, data_file: str, compact_threshold: int = 1024 * 1024):
+        super().__init__(data_file)
+        self.compact_threshold = compact_threshold
+        self.seq = 0
+        self._compact_next = False
+
+    def load_sessions(self) -> Iterator[Tuple[str, List[Dict]]]:
+        # 日志回放需要随机访问会话数据，只有日志为空 (刚合并过) 时才能增量读取快照
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > 0:
+            return super(SnapshotStorage, self).load_sessions()
+        self.seq = 0
+        return self._iter_snapshot()
+
+    def load(self) -> Dict[str, List[Dict]]:
+        data = self._read_snapshot()
+        snapshot_seq = data.pop(JOURNAL_SEQ_KEY, 0)
+        self.seq = snapshot_seq
+        if not os.path.exists(self.journal_file):
+            return data
+
+        replayed = 0
+        # 按字节逐行读取、在行内解码：截断在多字节字符中间的最后一行只影响这一行
+        with open(self.journal_file, "rb") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    op = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    # 通常是崩溃时写了一半的最后一行
+                    logger.warning(f"跳过损坏的记忆日志第 {line_no} 行")
+                    continue
+                seq = op.pop("seq", 0)
+                self.seq = max(self.seq, seq)
+                if seq <= snapshot_seq:
+                    continue
+                apply_op(data, op)
+                replayed += 1
+        if replayed:
+            logger.info(f"已回放 {replayed} 条记忆日志")
+        return data
+
+    def save(self, memories: Dict[str, List[Dict]], ops: List[Dict]):
+        if ops:
+            lines = []
+            for op in ops:
+                self.seq += 1
+                lines.append(json.dumps(dict(op, seq=self.seq), ensure_ascii=False, separators=(",", ":")))
+            with open(self.journal_file, "a", encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+        if self._compact_next:
+            self._compact_next = False
+            self.compact(memories)
+
+    def snapshot_sessions(self, ops: List[Dict]) -> Optional[Set[str]]:
+        # 只有需要合并时才要完整数据，平时仅追加变更记录
+        self._compact_next = self._needs_compact()
+        return None if self._compact_next else set()
+
+    def save_all(self, memories: Dict[str, List[Dict]]):
+        self.compact(memories)
+
+    def _needs_compact(self) -> bool:
+        return os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > self.compact_threshold
+
+    def maintenance_sessions(self) -> Optional[Set[str]]:
+        return None if self._needs_compact() else set()
+
+    def maintain(self, memories: Dict[str, List[Dict]]):
+        """日志超过 compact_threshold 时合并 (最后一次保存后才超过阈值、之后再无保存时，不必等到下次保存)"""
+        super().maintain(memories)
+        if self._needs_compact():
+            self.compact(memories)
+
+    def compact(self, memories: Dict[str, List[Dict]]):
+        """将日志合并进新快照并清空日志"""
+        self._write_snapshot(dict(memories, **{JOURNAL_SEQ_KEY: self.seq}))
+        open(self.journal_file, "w").close()
+        logger.info("记忆日志已合并为新快照")
+
+
+class SqliteStorage(StorageBackend):
+    """SQLite 存储 (WAL 模式)
+
+    变更记录按行写入：新增、编辑、调整重要性、删除均只触及相关行。内容通过 FTS5 trigram 索引支持子串搜索，
+    当前 SQLite 不支持时退回内存索引搜索。
+    首次使用时会自动从 memory_data.json (含日志) 迁移数据。
+    """
+
+    COLUMNS = ("content", "importance", "timestamp", "epoch", "memory_id")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS memories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            importance INTEGER NOT NULL,
+            timestamp TEXT,
+            epoch REAL,
+            memory_id TEXT,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_memories_session ON memories(session_id, position);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    # 后台整理 (WAL 截断、全文索引整理、空间回收) 的触发条件：累计写入足够多的变更，且距上次整理足够久
+    MAINTAIN_MIN_CHANGES = 1000
+    MAINTAIN_MIN_INTERVAL = 600
+
+    # meta 表中的标记：已完成 (或无需) 从 JSON 迁移；之后即使表为空也不再迁移，避免已删除的数据复活
+    MIGRATED_KEY = "json_migrated"
+
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+            content, content='memories', content_rowid='id', tokenize='trigram'
+        );
+        CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE OF content ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO memories_fts(rowid, content) VALUES (new.id, new.content);
+        END;
+    """
+
+    def __init__(self, data_file: str):
+        super().__init__(data_file)
+        self.db_file = os.path.splitext(data_file)[0] + ".db"
+        self.fts_enabled = False
+        self._conn: Optional[sqlite3.Connection] = None
+        # 加载、保存与维护 (后台线程) 共用写连接，需串行化
+        self._lock = threading.RLock()
+        # 搜索在事件循环线程执行，使用独立的只读连接：WAL 模式下读不会被写阻塞，也不等待写锁
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+        # 上次整理后写入的变更条数与整理时间
+        self._changes_since_maintain = 0
+        self._last_maintain = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        try:
+            fts_exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'memories_fts'").fetchone()
+            conn.executescript(self.FTS_SCHEMA)
+            if not fts_exists:
+                conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+                conn.commit()
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"当前 SQLite 不支持 FTS5 trigram，搜索将使用内存索引: {e}")
+        self._conn = conn
+        return conn
+
+    def _to_row(self, session_id: str, position: int, memory: Dict) -> tuple:
+        extra = {k: v for k, v in memory.items() if k not in self.COLUMNS}
+        return (session_id, position, memory["content"], memory["importance"],
+                memory.get("timestamp"), memory.get("epoch"), memory.get("memory_id"),
+                json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    def _from_row(self, row: tuple) -> Dict:
+        memory = {k: v for k, v in zip(self.COLUMNS, row) if v is not None}
+        if row[-1]:
+            memory.update(json.loads(row[-1]))
+        return memory
+
+    def _write_session(self, conn: sqlite3.Connection, session_id: str, memories: List[Dict]):
+        conn.execute("DELETE FROM memories WHERE session_id = ?", (session_id,))
+        conn.executemany(
+            "INSERT INTO memories (session_id, position, content, importance, timestamp, epoch, memory_id, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._to_row(session_id, i, m) for i, m in enumerate(memories)])
+
+    def load(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            try:
+                return self._load()
+            except sqlite3.DatabaseError as e:
+                # 数据库文件损坏：隔离数据库及其 WAL 文件，以空库启动
+                logger.error(f"加载 SQLite 记忆数据失败: {e}")
+                self.close()
+                self.quarantined = quarantine(self.db_file) is not None
+                for suffix in ("-wal", "-shm"):
+                    quarantine(self.db_file + suffix)
+                return {}
+
+    def _mark_migrated(self, conn: sqlite3.Connection):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')", (self.MIGRATED_KEY,))
+
+    def _load(self) -> Dict[str, List[Dict]]:
+        conn = self._connect()
+        if not conn.execute("SELECT 1 FROM meta WHERE key = ?", (self.MIGRATED_KEY,)).fetchone():
+            # 旧版本创建的数据库没有标记：已有数据说明迁移早已完成，只补写标记
+            if not conn.execute("SELECT 1 FROM memories LIMIT 1").fetchone() and os.path.exists(self.data_file):
+                data = JournalStorage(self.data_file).load()
+                self.save_all(data)
+                if data:
+                    logger.info(f"已将 {len(data)} 个会话的记忆从 JSON 迁移到 SQLite")
+                return data
+            with conn:
+                self._mark_migrated(conn)
+
+        data: Dict[str, List[Dict]] = {}
+        rows = conn.execute(
+            "SELECT session_id, content, importance, timestamp, epoch, memory_id, extra "
+            "FROM memories ORDER BY session_id, position")
+        for row in rows:
+            data.setdefault(row[0], []).append(self._from_row(row[1:]))
+        return data
+
+    def snapshot_sessions(self, ops: List[Dict]) -> Optional[Set[str]]:
+        # 所有变更都按行应用，无需会话副本
+        return set()
+
+    def save(self, memories: Dict[str, List[Dict]], ops: List[Dict]):
+        if not ops:
+            return
+        with self._lock, self._connect() as conn:
+            self._changes_since_maintain += len(ops)
+            for op in ops:
+                session_id = op["sid"]
+                kind = op["op"]
+                if kind == "add":
+                    position = conn.execute(
+                        "SELECT COUNT(*) FROM memories WHERE session_id = ?", (session_id,)).fetchone()[0]
+                    conn.execute(
+                        "INSERT INTO memories (session_id, position, content, importance, timestamp, epoch, memory_id, extra) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._to_row(session_id, position, op["memory"]))
+                elif kind == "clear":
+                    conn.execute("DELETE FROM memories WHERE session_id = ?", (session_id,))
+                elif kind == "remove":
+                    conn.execute("DELETE FROM memories WHERE session_id = ? AND position = ?", (session_id, op["i"]))
+                    conn.execute("UPDATE memories SET position = position - 1 WHERE session_id = ? AND position > ?",
+                                 (session_id, op["i"]))
+                elif kind == "edit":
+                    conn.execute("UPDATE memories SET content = ? WHERE session_id = ? AND position = ?",
+                                 (op["content"], session_id, op["i"]))
+                elif kind == "importance":
+                    conn.execute("UPDATE memories SET importance = ? WHERE session_id = ? AND position = ?",
+                                 (op["importance"], session_id, op["i"]))
+                elif kind == "touch":
+                    conn.execute("UPDATE memories SET timestamp = ?, epoch = ?, importance = ? "
+                                 "WHERE session_id = ? AND position = ?",
+                                 (op["timestamp"], op["epoch"], op["importance"], session_id, op["i"]))
+                elif kind == "hit":
+                    conn.execute("UPDATE memories SET extra = json_set(COALESCE(extra, '{}'), '$.hits', ?, '$.last_hit', ?) "
+                                 "WHERE session_id = ? AND position = ?",
+                                 (op["hits"], op["last_hit"], session_id, op["i"]))
+                elif kind == "decay":
+                    conn.execute("UPDATE memories SET importance = ?, extra = json_set(COALESCE(extra, '{}'), '$.decayed_at', ?) "
+                                 "WHERE session_id = ? AND position = ?",
+                                 (op["importance"], op["decayed_at"], session_id, op["i"]))
+
+    def save_all(self, memories: Dict[str, List[Dict]]):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM memories")
+            for session_id, session in memories.items():
+                self._write_session(conn, session_id, session)
+                self._changes_since_maintain += len(session)
+            # 整体写入 (迁移或运行中切换到 SQLite) 后数据库即为权威数据，不再从 JSON 迁移
+            self._mark_migrated(conn)
+
+    def search(self, session_id: str, keyword: str) -> Optional[List[int]]:
+        # trigram 索引至少需要 3 个字符
+        if not self.fts_enabled or len(keyword) < 3:
+            return None
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        with self._read_lock:
+            if self._read_conn is None:
+                self._read_conn = sqlite3.connect(self.db_file, check_same_thread=False)
+                self._read_conn.execute("PRAGMA query_only=1")
+            rows = self._read_conn.execute(
+                "SELECT m.position FROM memories_fts f JOIN memories m ON m.id = f.rowid "
+                "WHERE memories_fts MATCH ? AND m.session_id = ? ORDER BY m.position",
+                (phrase, session_id)).fetchall()
+        return [row[0] for row in rows]
+
+    def maintain(self, memories: Dict[str, List[Dict]]):
+        """截断 WAL、整理全文索引，空闲页较多时回收数据库空间
+
+        这些操作需要独占写连接且耗时随数据量增长，因此只在上次整理后累计了 MAINTAIN_MIN_CHANGES 条变更、
+        并且间隔超过 MAINTAIN_MIN_INTERVAL 秒时执行；平时 WAL 由 SQLite 自动检查点控制大小。
+        """
+        if self._changes_since_maintain < self.MAINTAIN_MIN_CHANGES or \
+                time.monotonic() - self._last_maintain < self.MAINTAIN_MIN_INTERVAL:
+            return
+        with self._lock:
+            self._changes_since_maintain = 0
+            self._last_maintain = time.monotonic()
+            conn = self._connect()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if self.fts_enabled:
+                conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('optimize')")
+                conn.commit()
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            total_pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            if free_pages > 256 and free_pages * 4 > total_pages:
+                conn.execute("VACUUM")
+                logger.info(f"记忆数据库已回收 {free_pages} 个空闲页")
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(f) for f in (self.db_file, self.db_file + "-wal") if os.path.exists(f))
+
+    def close(self):
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ShardedStorage(StorageBackend):
+    """按会话分片存储
+
+    每个会话一个分片文件 (编码格式同快照)，另有 index.json 记录会话到分片的映射。启动时只读取索引，
+    会话数据在首次访问时加载；保存时只重写有变更的分片，单个分片损坏只影响该会话。
+    索引损坏或丢失时会扫描分片文件重建。首次使用时会自动从 memory_data.json (含日志) 迁移数据。
+    """
+
+    lazy = True
+    INDEX_FILE = "index.json"
+
+    def __init__(self, data_file: str):
+        super().__init__(data_file)
+        self.shard_dir = os.path.splitext(data_file)[0] + "_shards"
+        self.index_file = os.path.join(self.shard_dir, self.INDEX_FILE)
+        # 会话 -> {"file": 分片文件名, "count": 记忆条数}
+        self._index: Optional[Dict[str, Dict]] = None
+        # 保存在后台线程执行，按需加载在事件循环线程执行，内存中的索引需串行化访问；
+        # 写分片与索引文件时不持有此锁 (写入方由 MemoryManager 的保存锁串行化)，只在更新索引时短暂持有
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def shard_name(session_id: str) -> str:
+        # 会话 ID 含冒号等字符，不能直接作为文件名
+        return hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:20] + ".json"
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if self._index is not None:
+            return self._index
+        if os.path.exists(self.index_file):
+            try:
+                self._index, self.loaded_codec = codec.read_file(self.index_file)
+                return self._index
+            except Exception as e:
+                logger.error(f"读取记忆分片索引失败，将扫描分片重建: {e}")
+                self._index = self._scan_shards()
+                self._write_file(self.index_file, self._index)
+                return self._index
+
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self._index = self._scan_shards()
+        if not self._index and os.path.exists(self.data_file):
+            data = JournalStorage(self.data_file).load()
+            if data:
+                self.save_all(data)
+                logger.info(f"已将 {len(data)} 个会话的记忆从 JSON 迁移到分片存储")
+                return self._index
+        self._write_file(self.index_file, self._index)
+        return self._index
+
+    def _scan_shards(self) -> Dict[str, Dict]:
+        index = {}
+        if not os.path.isdir(self.shard_dir):
+            return index
+        for name in os.listdir(self.shard_dir):
+            if name == self.INDEX_FILE or not name.endswith(".json"):
+                continue
+            path = os.path.join(self.shard_dir, name)
+            try:
+                shard, _ = codec.read_file(path)
+                index[shard["session_id"]] = {"file": name, "count": len(shard["memories"])}
+            except Exception as e:
+                logger.error(f"跳过损坏的记忆分片 {name}: {e}")
+                quarantine(path)
+        return index
+
+    def load(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            self._index = None
+            self._load_index()
+        return {}
+
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._load_index())
+
+    def has_session(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._load_index()
+
+    def session_size(self, session_id: str) -> int:
+        with self._lock:
+            entry = self._load_index().get(session_id)
+        return entry["count"] if entry else 0
+
+    def load_session(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            entry = self._load_index().get(session_id)
+        if entry is None:
+            return []
+        path = os.path.join(self.shard_dir, entry["file"])
+        try:
+            return codec.read_file(path)[0]["memories"]
+        except FileNotFoundError as e:
+            logger.error(f"加载会话 {session_id} 的记忆分片失败: {e}")
+            return []
+        except Exception as e:
+            # 隔离损坏的分片，该会话按空会话处理，失效的索引项由后台维护移除
+            logger.error(f"加载会话 {session_id} 的记忆分片失败: {e}")
+            quarantine(path)
+            return []
+
+    def snapshot_sessions(self, ops: List[Dict]) -> Optional[Set[str]]:
+        return {op["sid"] for op in ops}
+
+    def _write_session(self, session_id: str, memories: Optional[List[Dict]]) -> Optional[Dict]:
+        """写入或删除单个会话的分片，返回新的索引项 (会话为空时为 None)"""
+        name = self.shard_name(session_id)
+        path = os.path.join(self.shard_dir, name)
+        if not memories:
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        self._write_file(path, {"session_id": session_id, "memories": memories})
+        return {"file": name, "count": len(memories)}
+
+    def save(self, memories: Dict[str, List[Dict]], ops: List[Dict]):
+        if not ops:
+            return
+        with self._lock:
+            self._load_index()
+        entries = {session_id: self._write_session(session_id, memories.get(session_id))
+                   for session_id in {op["sid"] for op in ops}}
+        with self._lock:
+            index = self._load_index()
+            changed = False
+            for session_id, entry in entries.items():
+                if entry is None:
+                    changed |= index.pop(session_id, None) is not None
+                else:
+                    changed |= index.get(session_id) != entry
+                    index[session_id] = entry
+            index_copy = dict(index) if changed else None
+        if index_copy is not None:
+            self._write_file(self.index_file, index_copy)
+
+    def save_all(self, memories: Dict[str, List[Dict]]):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        index: Dict[str, Dict] = {}
+        for session_id, session in memories.items():
+            entry = self._write_session(session_id, session)
+            if entry is not None:
+                index[session_id] = entry
+        with self._lock:
+            self._index = index
+        self._write_file(self.index_file, dict(index))
+        # 清理不再属于任何会话的旧分片
+        live = {entry["file"] for entry in index.values()}
+        for name in os.listdir(self.shard_dir):
+            if name.endswith(".json") and name != self.INDEX_FILE and name not in live:
+                os.remove(os.path.join(self.shard_dir, name))
+
+    def maintain(self, memories: Dict[str, List[Dict]]):
+        """核对索引与分片文件：清理残留的 .tmp 文件，收回索引之外的分片 (写分片后、写索引前崩溃所致)，
+        移除文件已丢失的索引项"""
+        if not os.path.isdir(self.shard_dir):
+            return
+        with self._lock:
+            index = self._load_index()
+            names = set(os.listdir(self.shard_dir))
+            live = {entry["file"] for entry in index.values()}
+            changed = False
+            for name in names:
+                if name.endswith(".tmp"):
+                    os.remove(os.path.join(self.shard_dir, name))
+                elif name.endswith(".json") and name != self.INDEX_FILE and name not in live:
+                    try:
+                        shard, _ = codec.read_file(os.path.join(self.shard_dir, name))
+                    except Exception as e:
+                        logger.error(f"跳过损坏的记忆分片 {name}: {e}")
+                        quarantine(os.path.join(self.shard_dir, name))
+                        continue
+                    if shard["session_id"] not in index and shard["memories"]:
+                        index[shard["session_id"]] = {"file": name, "count": len(shard["memories"])}
+                        changed = True
+                        logger.info(f"已收回未登记的记忆分片 {name}")
+            for session_id in [sid for sid, entry in index.items() if entry["file"] not in names]:
+                logger.warning(f"会话 {session_id} 的记忆分片已丢失，移出索引")
+                del index[session_id]
+                changed = True
+            if changed:
+                self._write_file(self.index_file, index)
+
+    def size_bytes(self) -> int:
+        if not os.path.isdir(self.shard_dir):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.shard_dir) if entry.is_file())
+
+
+STORAGE_BACKENDS = {
+    "snapshot": SnapshotStorage,
+    "journal": JournalStorage,
+    "sqlite": SqliteStorage,
+    "sharded": ShardedStorage,
+}
@@ -0,0 +1,8 @@
+"""测试公共设置：插件以包的形式导入 (模块间使用相对导入)，统一以 memory_plugin 为包名"""
+import importlib
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+sys.modules.setdefault("memory_plugin", importlib.import_module(os.path.basename(PLUGIN_DIR)))
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from memory_plugin.memory_manager import MemoryManager
+from memory_plugin.storage import JournalStorage
+
+
+def make_manager(tmp_path, **config) -> MemoryManager:
+    return MemoryManager(str(tmp_path / "memories.json"), config)
+
+
+def contents(manager: MemoryManager, session_id: str):
+    return sorted(m["content"] for m in manager.get_memories(session_id))
+
+
+@pytest.mark.parametrize("mode", ["snapshot", "journal", "sqlite", "sharded"])
+def test_failed_save_is_retried_in_full(tmp_path, monkeypatch, mode):
+    manager = make_manager(tmp_path, storage_mode=mode)
+    manager.add_memory("s", "服务器在上海机房", 3)
+    asyncio.run(manager.flush())
+    manager.add_memory("s", "管理员每周日做一次维护", 2)
+    manager.add_memory("t", "喜欢吃火锅但不吃香菜", 4)
+
+    storage = manager._get_storage()
+    real_save = storage.save
+    calls = []
+
+    def fail_once(snapshot, ops):
+        calls.append(len(ops))
+        if len(calls) == 1:
+            raise OSError("disk full")
+        return real_save(snapshot, ops)
+
+    monkeypatch.setattr(storage, "save", fail_once)
+    asyncio.run(manager.save_memories())
+    assert manager.perf.counters["save_failures"] == 1
+    asyncio.run(manager.save_memories())
+    assert calls == [2, 2]
+    assert not manager._ops
+    manager.close()
+
+    reloaded = make_manager(tmp_path, storage_mode=mode)
+    assert contents(reloaded, "s") == contents(manager, "s")
+    assert contents(reloaded, "t") == ["喜欢吃火锅但不吃香菜"]
+    reloaded.close()
+
+
+def test_failed_load_does_not_overwrite_storage(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, storage_mode="journal", journal_compact_kb=0)
+    manager.add_memory("s", "服务器在上海机房", 3)
+    asyncio.run(manager.flush())
+    manager.close()
+
+    def broken_load(self):
+        raise RuntimeError("unexpected")
+        yield
+
+    monkeypatch.setattr(JournalStorage, "load_sessions", broken_load)
+    broken = make_manager(tmp_path, storage_mode="journal", journal_compact_kb=0)
+    assert broken.get_memories("s") == []
+    broken.add_memory("t", "喜欢吃火锅", 2)
+    asyncio.run(broken.flush())
+    asyncio.run(broken.maintain_storage())
+    broken.close()
+    monkeypatch.undo()
+
+    reloaded = make_manager(tmp_path, storage_mode="journal")
+    assert contents(reloaded, "s") == ["服务器在上海机房"]
+    assert reloaded.get_memories("t") == []
+    reloaded.close()
+
+
+@pytest.mark.parametrize("mode", ["snapshot", "journal", "sqlite", "sharded"])
+def test_repeated_hits_are_merged_per_memory(tmp_path, mode):
+    manager = make_manager(tmp_path, storage_mode=mode)
+    for content in ("服务器在上海机房", "管理员每周日做一次维护", "喜欢吃火锅但不吃香菜"):
+        manager.add_memory("s", content, 3)
+    asyncio.run(manager.flush())
+    for _ in range(2000):
+        manager.record_hits("s", manager.get_memories("s"))
+    # 命中之后删除的记忆不应让折叠出的 hit 变更错位
+    manager.remove_memory("s", 0)
+    assert len(manager._ops) == 1
+
+    asyncio.run(manager.flush())
+    assert manager.perf.counters["last_save_ops"] == 1 + 2
+    manager.close()
+
+    reloaded = make_manager(tmp_path, storage_mode=mode)
+    assert {m["content"]: m["hits"] for m in reloaded.get_memories("s")} == \
+        {m["content"]: m["hits"] for m in manager.get_memories("s")}
+    assert all(m["hits"] == 2000 for m in reloaded.get_memories("s"))
+    reloaded.close()
+
+
+def test_short_memory_contained_in_longer_one_is_merged(tmp_path):
+    manager = make_manager(tmp_path, max_memories=50)
+    # 新内容只占已有内容的一小部分，MinHash 签名相差很大，LSH 分桶找不到它
+    manager.add_memory("s", "[张三(10001) 提到]: 公司的测试服务器在上海机房，管理员是老王，"
+                            "每周日凌晨做一次维护，维护期间会停止全部对外服务，有问题请提前在群里说明", 2)
+    for content in ("喜欢吃火锅但不吃香菜", "周末经常去爬山", "最近在学习吉他", "家里养了一只橘猫"):
+        manager.add_memory("s", content, 1)
+    manager.add_memory("s", "服务器在上海机房，管理员是老王", 4)
+    assert len(manager.get_memories("s")) == 5
+    assert manager.get_memories("s")[0]["importance"] == 4
+    # 不长于 10 个字符的内容仍只在完全一致时合并
+    manager.add_memory("s", "管理员是老王", 1)
+    assert len(manager.get_memories("s")) == 6
+
+
+def test_full_save_does_not_reload_cleared_sessions(tmp_path):
+    manager = make_manager(tmp_path, storage_mode="sharded", max_resident_sessions=1)
+    for i in range(3):
+        manager.add_memory(f"s{i}", f"第 {i} 个会话里关于火锅的记忆内容", 2)
+        asyncio.run(manager.flush())
+    manager.clear_memories("s0")
+    # 切换存储后首次保存为整体写入，需要先读入未常驻的会话
+    manager.config["storage_mode"] = "snapshot"
+    asyncio.run(manager.save_memories())
+    assert "s0" not in manager.memories
+
+    reloaded = make_manager(tmp_path, storage_mode="snapshot")
+    assert sorted(reloaded.memories) == ["s1", "s2"]
+
+
+def test_export_survives_storage_switch_midway(tmp_path):
+    manager = make_manager(tmp_path, storage_mode="sharded", max_resident_sessions=1)
+    for i in range(5):
+        manager.add_memory(f"s{i}", f"第 {i} 个会话里关于火锅的记忆内容", 2)
+        asyncio.run(manager.flush())
+    records = manager.iter_export_records()
+    exported = [next(records)]
+    # 导出途中清空一个未常驻的会话并切换存储整体保存，惰性来源随之被清空
+    manager.clear_memories("s0")
+    manager.config["storage_mode"] = "snapshot"
+    asyncio.run(manager.save_memories())
+    assert manager._lazy_source is None
+    exported.extend(records)
+    assert sorted(r["session_id"] for r in exported) == ["s1", "s2", "s3", "s4"]
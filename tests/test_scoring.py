@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from memory_plugin.memory_manager import MemoryManager  # noqa: E402
+from memory_plugin.scoring import MATCH_FLOOR  # noqa: E402
+
+MEMORIES = [
+    ("服务器在上海机房", 3),
+    ("管理员是老王", 2),
+    ("喜欢吃火锅但不吃香菜", 1),
+    ("周末经常去爬山", 5),
+]
+
+
+def make_manager(tmp_path, engine: str) -> MemoryManager:
+    manager = MemoryManager(str(tmp_path / f"{engine}.json"), {"scoring_engine": engine, "max_memories": 50})
+    for content, importance in MEMORIES:
+        manager.add_memory("s", content, importance)
+    for memory in manager.get_memories("s"):
+        # 排除 24 小时内的新鲜度加成，只比较匹配分
+        memory["epoch"] = 0
+    return manager
+
+
+def strong(manager: MemoryManager, query: str):
+    return {m["content"] for score, m in manager.score_memories("s", query, 10) if score >= MATCH_FLOOR}
+
+
+@pytest.mark.parametrize("query, expected", [
+    # 整句包含
+    ("上海机房", {"服务器在上海机房"}),
+    # 只共享一个 bigram ("老王")，bigram 引擎下即为强相关
+    ("老王今天来吗", {"管理员是老王"}),
+    # 分别命中两条记忆的少量 bigram
+    ("上海的火锅", {"服务器在上海机房", "喜欢吃火锅但不吃香菜"}),
+    # 没有任何命中，兜底时只取最高分的一条
+    ("明天天气如何", set()),
+])
+def test_bm25_crosses_fallback_threshold_like_bigram(tmp_path, query, expected):
+    bigram = make_manager(tmp_path, "bigram")
+    bm25 = make_manager(tmp_path, "bm25")
+    assert strong(bigram, query) == expected
+    assert strong(bm25, query) == expected
+
+
+def test_bm25_keeps_full_match_on_top(tmp_path):
+    bm25 = make_manager(tmp_path, "bm25")
+    scored = bm25.score_memories("s", "上海机房", 10)
+    assert scored[0][1]["content"] == "服务器在上海机房"
+    assert MATCH_FLOOR < scored[0][0] <= 40 + 3
@@ -0,0 +1,18 @@
+from memory_plugin.storage import JournalStorage
+
+
+def test_journal_skips_line_truncated_inside_multibyte_character(tmp_path):
+    data_file = str(tmp_path / "memories.json")
+    storage = JournalStorage(data_file)
+    memory = {"content": "服务器在上海机房", "importance": 3}
+    storage.save({}, [{"op": "add", "sid": "s", "memory": memory}])
+    storage.save({}, [{"op": "add", "sid": "s", "memory": dict(memory, content="管理员是老王")}])
+    with open(storage.journal_file, "rb") as f:
+        raw = f.read()
+    # 砍掉最后一行末尾几个字节，使其停在某个汉字的 UTF-8 编码中间
+    cut = raw.rindex("老王".encode("utf-8")) + 1
+    with open(storage.journal_file, "wb") as f:
+        f.write(raw[:cut])
+
+    loaded = JournalStorage(data_file).load()
+    assert [m["content"] for m in loaded["s"]] == ["服务器在上海机房"]